@@ -1,32 +1,60 @@
 from typing import Dict, Any
-import json
-from app.services.blip_captioner import caption_image_bytes
+from app.services.blip_captioner import acaption_image_bytes, caption_image_bytes
 from app.services.prompt_loader import render_prompt
-from app.services.llm_invoker import call_openai_prompt
+from app.services.llm_invoker import acall_openai_prompt, call_openai_prompt
+from app.services.event_stream import emit
+from app.services.structured_output import LLM_JSON_MODE, parse_completion
 
-def agent_1_node(state: Dict[str, Any]) -> Dict[str, Any]:
-    image_bytes = state.get('image')
-    user_text = state.get('text') or ''
-    if not image_bytes:
-        state["agent"] = "fallback"
-        state["response"] = "Please upload a photo of the issue so I can diagnose it."
-        return state
-    
-    caption = caption_image_bytes(image_bytes)
-    prompt = render_prompt(
+_NO_IMAGE_RESPONSE = "Please upload a photo of the issue so I can diagnose it."
+
+def _build_prompt(state: Dict[str, Any], caption: str, user_text: str) -> str:
+    return render_prompt(
         "agent_1_diagnosis.j2",
         {
             "caption": caption,
-            "user_text": user_text
+            "user_text": user_text,
+            "history": state.get("history"),
         },)
-    
-    completion = call_openai_prompt(prompt)
-    try:
-        parsed = json.loads(completion)
-        state["response"] = json.dumps(parsed, ensure_ascii=False, indent=2)
-    except Exception:
-        state["response"] = completion
 
-    state["caption"] = caption
+def _apply_completion(state: Dict[str, Any], completion: str) -> Dict[str, Any]:
+    state["data"], state["response"] = parse_completion("agent_1", completion)
     state["agent"] = 'agent_1'
-    return state
\ No newline at end of file
+    return state
+
+def agent_1_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    image_bytes = state.get('image')
+    user_text = state.get('text') or ''
+    if image_bytes:
+        caption = caption_image_bytes(image_bytes)
+        state["caption"] = caption
+        emit("caption", {"caption": caption})
+    elif state.get("last_caption"):
+        # follow-up about the photo from an earlier turn: prompt context only, this turn has no image
+        caption = state["last_caption"]
+    else:
+        state["agent"] = "fallback"
+        state["response"] = _NO_IMAGE_RESPONSE
+        return state
+
+    completion = call_openai_prompt(_build_prompt(state, caption, user_text), agent="agent_1",
+                                    json_mode=LLM_JSON_MODE)
+    return _apply_completion(state, completion)
+
+async def agent_1_node_async(state: Dict[str, Any]) -> Dict[str, Any]:
+    image_bytes = state.get('image')
+    user_text = state.get('text') or ''
+    if image_bytes:
+        caption = await acaption_image_bytes(image_bytes)
+        state["caption"] = caption
+        emit("caption", {"caption": caption})
+    elif state.get("last_caption"):
+        # follow-up about the photo from an earlier turn: prompt context only, this turn has no image
+        caption = state["last_caption"]
+    else:
+        state["agent"] = "fallback"
+        state["response"] = _NO_IMAGE_RESPONSE
+        return state
+
+    completion = await acall_openai_prompt(_build_prompt(state, caption, user_text), agent="agent_1",
+                                          json_mode=LLM_JSON_MODE)
+    return _apply_completion(state, completion)
@@ -1,27 +1,68 @@
-from typing import Dict, Any
-import json
-from app.services.prompt_loader import render_prompt
-from app.services.llm_invoker import call_openai_prompt
+import asyncio
+from typing import Dict, Any, Optional
+from app.services.prompt_loader import render_prompt, template_version
+from app.services.llm_invoker import acall_openai_prompt, call_openai_prompt
+from app.services.response_cache import get_response_cache
+from app.services.structured_output import LLM_JSON_MODE, parse_completion
 
-def agent_2_node(state: Dict[str, Any]) -> Dict[str, Any]:
+TEMPLATE_NAME = "agent_2_tenancy.j2"
+
+def _build_prompt(state: Dict[str, Any]) -> str:
     question = (state.get("text") or "").strip()
     location = (state.get("location") or "").strip() or None
 
-    prompt = render_prompt(
-        "agent_2_tenancy.j2",
+    return render_prompt(
+        TEMPLATE_NAME,
         {
             "question": question,
-            "location": location
+            "location": location,
+            "history": state.get("history"),
         },
     )
 
-    completion = call_openai_prompt(prompt)
+def _apply_completion(state: Dict[str, Any], completion: str) -> Dict[str, Any]:
+    state["data"], state["response"] = parse_completion("agent_2", completion)
+    state["agent"] = "agent_2"
+    return state
 
-    try:
-        parsed = json.loads(completion)
-        state["response"] = json.dumps(parsed, ensure_ascii=False, indent=2)
-    except Exception:
-        state["response"] = completion
+def _cacheable(state: Dict[str, Any]) -> bool:
+    # the prompt carries the session history, which the cache key does not, so
+    # only a turn rendered without any conversation may be served from or stored in it
+    return not state.get("followup") and not state.get("history")
 
-    state["agent"] = "agent_2"
-    return state
\ No newline at end of file
+def _cache_get(state: Dict[str, Any]) -> Optional[str]:
+    cache = get_response_cache()
+    if cache is None or state.get("cache_bypass") or not _cacheable(state):
+        return None
+    return cache.get(state.get("text") or "", state.get("location"), template_version(TEMPLATE_NAME))
+
+def _cache_put(state: Dict[str, Any], completion: str) -> None:
+    cache = get_response_cache()
+    if cache is not None and completion and _cacheable(state):
+        # a bypassed request still refreshes the cached answer
+        cache.put(state.get("text") or "", state.get("location"), template_version(TEMPLATE_NAME), completion)
+
+def agent_2_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    completion = _cache_get(state)
+    state["cache_hit"] = completion is not None
+    if completion is not None:
+        return _apply_completion(state, completion)
+    completion = call_openai_prompt(_build_prompt(state), agent="agent_2", json_mode=LLM_JSON_MODE)
+    _apply_completion(state, completion)
+    # a reply that did not parse would otherwise be served for the whole TTL
+    if state["data"] is not None:
+        _cache_put(state, completion)
+    return state
+
+async def agent_2_node_async(state: Dict[str, Any]) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    # the semantic tier runs a local encoder, so lookups go through the default pool
+    completion = await loop.run_in_executor(None, _cache_get, state)
+    state["cache_hit"] = completion is not None
+    if completion is not None:
+        return _apply_completion(state, completion)
+    completion = await acall_openai_prompt(_build_prompt(state), agent="agent_2", json_mode=LLM_JSON_MODE)
+    _apply_completion(state, completion)
+    if state["data"] is not None:
+        await loop.run_in_executor(None, _cache_put, state, completion)
+    return state
@@ -1,23 +1,71 @@
-from typing import Dict, Any
-import json
+import asyncio
+import os
+from typing import Dict, Any, Optional
+from app.agents.agent_1_image_issue import agent_1_node_async
+from app.agents.agent_2_faq import agent_2_node_async
 from app.services.prompt_loader import render_prompt
-from app.services.llm_invoker import call_openai_prompt
+from app.services.llm_invoker import acall_openai_prompt, call_openai_prompt
+from app.services.event_stream import emit, muted
+from app.services.structured_output import LLM_JSON_MODE, parse_completion
 
-def fallback_node(state: Dict[str, Any]) -> Dict[str, Any]:
+# a suggestion at least this confident is answered in the same request
+FALLBACK_REDISPATCH_CONFIDENCE = float(os.getenv("FALLBACK_REDISPATCH_CONFIDENCE", "0.75"))
+# start the likely agent's LLM call alongside the clarifier (costs a call when the guess is wrong)
+FALLBACK_SPECULATE = os.getenv("FALLBACK_SPECULATE", "0") == "1"
+
+_ASYNC_AGENTS = {"agent_1": agent_1_node_async, "agent_2": agent_2_node_async}
+
+def _build_prompt(state: Dict[str, Any]) -> str:
     user_text = state.get("text") or ""
-    prompt = render_prompt("fallback_clarifier.j2", {"user_text": user_text})
-    completion = call_openai_prompt(prompt)
+    return render_prompt("fallback_clarifier.j2", {"user_text": user_text, "history": state.get("history")})
 
-    try:
-        parsed = json.loads(completion)
-        state["response"] = json.dumps(parsed, ensure_ascii=False, indent=2)
-        suggested = parsed.get("suggested_agent")
-        if suggested in {"agent_1", "agent_2"}:
-            state["agent"] = suggested
-        else:
-            state["agent"] = "fallback"
-    except Exception:
-        state["response"] = completion
+def _can_answer(state: Dict[str, Any], agent: str) -> bool:
+    # agent_1 needs something to look at; text-only turns only have an earlier photo's caption
+    return agent == "agent_2" or bool(state.get("image") or state.get("last_caption"))
+
+def _apply_completion(state: Dict[str, Any], completion: str) -> Dict[str, Any]:
+    state["redispatch"] = None
+    data, state["response"] = parse_completion("fallback", completion)
+    state["data"] = data
+    suggested = data.suggested_agent if data is not None else None
+    if suggested in {"agent_1", "agent_2"}:
+        state["agent"] = suggested
+        emit("agent", {"agent": suggested})
+        if data.confidence >= FALLBACK_REDISPATCH_CONFIDENCE and _can_answer(state, suggested):
+            state["redispatch"] = suggested
+    else:
         state["agent"] = "fallback"
-    
-    return state
\ No newline at end of file
+
+    return state
+
+def _speculation_target(state: Dict[str, Any]) -> Optional[str]:
+    if not FALLBACK_SPECULATE:
+        return None
+    intent = state.get("intent") or {}
+    guess = intent.get("agent") if intent.get("agent") in _ASYNC_AGENTS else "agent_2"
+    return guess if _can_answer(state, guess) else None
+
+def fallback_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    completion = call_openai_prompt(_build_prompt(state), agent="fallback", json_mode=LLM_JSON_MODE)
+    return _apply_completion(state, completion)
+
+async def fallback_node_async(state: Dict[str, Any]) -> Dict[str, Any]:
+    guess = _speculation_target(state)
+    speculative = None
+    if guess:
+        with muted():
+            speculative = asyncio.ensure_future(_ASYNC_AGENTS[guess](dict(state, agent=guess)))
+    try:
+        completion = await acall_openai_prompt(_build_prompt(state), agent="fallback", json_mode=LLM_JSON_MODE)
+        _apply_completion(state, completion)
+        if speculative is not None and state.get("redispatch") == guess:
+            try:
+                answered = await speculative
+            except Exception:
+                return state  # let the graph run the agent for real
+            state.update(answered)
+            state["redispatch"] = None
+        return state
+    finally:
+        if speculative is not None and not speculative.done():
+            speculative.cancel()
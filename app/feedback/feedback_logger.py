@@ -1,19 +1,41 @@
-import json
+import os
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any
 
-_feedback_file = Path(__file__).resolve().parents[1]/"feedback_log.jsonl"
+from app.feedback.feedback_store import get_feedback_store
+from app.feedback.log_writer import close_log_writer, get_log_writer
+
+_feedback_file = Path(os.getenv("FEEDBACK_LOG_PATH") or Path(__file__).resolve().parents[1]/"feedback_log.jsonl")
 
 def log_feedback(state: Dict[str, Any]) -> None:
     data = {
         "timestamp": datetime.utcnow().isoformat(),
         "session_id": state.get("session_id"),
+        "turn_id": state.get("turn_id"),
         "agent": state.get("agent"),
         "input_text": state.get("text"),
         "image_caption": state.get("caption"),
         "response": state.get("response"),
         "feedback": state.get("feedback"),
     }
-    with _feedback_file.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(data, ensure_ascii=False) + "\n")
\ No newline at end of file
+    # enqueue only; the writer thread batches, serializes and rotates
+    _get_writer().write(data)
+
+def log_rating(session_id: str, turn_id: str, rating: str) -> None:
+    # a rating is its own record; the store applies it to the turn's row
+    _get_writer().write({
+        "timestamp": datetime.utcnow().isoformat(),
+        "event": "rating",
+        "session_id": session_id,
+        "turn_id": turn_id,
+        "feedback": rating,
+    })
+
+def _get_writer():
+    store = get_feedback_store()
+    # committed batches are mirrored into the indexed store on the writer thread
+    return get_log_writer(_feedback_file, sinks=[store.insert_many] if store else ())
+
+def shutdown_feedback_log() -> None:
+    close_log_writer()
@@ -0,0 +1,166 @@
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+FEEDBACK_DB_PATH = os.getenv("FEEDBACK_DB_PATH")  # unset = store disabled, JSONL only
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS feedback ("
+    "id INTEGER PRIMARY KEY,"
+    "timestamp TEXT NOT NULL,"
+    "session_id TEXT,"
+    "turn_id TEXT,"
+    "agent TEXT,"
+    "feedback TEXT,"
+    "input_text TEXT,"
+    "image_caption TEXT,"
+    "response_chars INTEGER)",
+    # the same turn logged twice (live sink + a later import) collapses to one row
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_feedback_ts_session ON feedback(timestamp, session_id)",
+    "CREATE INDEX IF NOT EXISTS idx_feedback_session ON feedback(session_id, timestamp)",
+    # covering indexes: aggregates over a time range never touch the table rows
+    "CREATE INDEX IF NOT EXISTS idx_feedback_ts_agent_fb ON feedback(timestamp, agent, feedback)",
+    "CREATE INDEX IF NOT EXISTS idx_feedback_agent_ts ON feedback(agent, timestamp, feedback)",
+    "CREATE INDEX IF NOT EXISTS idx_feedback_fb_ts ON feedback(feedback, timestamp)",
+)
+# run after adding turn_id to tables created before it existed
+_TURN_INDEX = "CREATE INDEX IF NOT EXISTS idx_feedback_turn ON feedback(turn_id)"
+
+def _row(record: Dict[str, Any]) -> tuple:
+    return (
+        str(record.get("timestamp") or ""),
+        record.get("session_id"),
+        record.get("turn_id"),
+        record.get("agent"),
+        record.get("feedback"),
+        record.get("input_text"),
+        record.get("image_caption"),
+        len(record.get("response") or ""),
+    )
+
+class FeedbackStore:
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in _SCHEMA:
+            self._conn.execute(stmt)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(feedback)")}
+        if "turn_id" not in columns:
+            self._conn.execute("ALTER TABLE feedback ADD COLUMN turn_id TEXT")
+        self._conn.execute(_TURN_INDEX)
+
+    def insert_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Insert turn records and apply rating records to their turns; returns rows inserted."""
+        rows, ratings = [], []
+        for r in records:
+            if r.get("event") == "rating":
+                if r.get("turn_id") and r.get("feedback"):
+                    ratings.append((r["feedback"], r["turn_id"]))
+            elif r.get("timestamp"):
+                rows.append(_row(r))
+        if not rows and not ratings:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO feedback "
+                    "(timestamp, session_id, turn_id, agent, feedback, input_text, image_caption, response_chars) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                inserted = self._conn.total_changes - before
+                # turns come before their ratings in the log, so a batch's inserts land first
+                self._conn.executemany("UPDATE feedback SET feedback = ? WHERE turn_id = ?", ratings)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return inserted
+
+    def stats(self, since: str, until: str, agent: Optional[str] = None) -> Dict[str, Any]:
+        sql = (
+            "SELECT agent, feedback, COUNT(*) FROM feedback "
+            "WHERE timestamp >= ? AND timestamp < ?"
+        )
+        params: List[Any] = [since, until]
+        if agent:
+            sql += " AND agent = ?"
+            params.append(agent)
+        sql += " GROUP BY agent, feedback"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        by_agent: Dict[str, Dict[str, Any]] = {}
+        for agent_name, rating, count in rows:
+            bucket = by_agent.setdefault(agent_name or "unknown", {"turns": 0, "up": 0, "down": 0})
+            bucket["turns"] += count
+            if rating in ("up", "down"):
+                bucket[rating] += count
+        for bucket in by_agent.values():
+            rated = bucket["up"] + bucket["down"]
+            bucket["thumbs_down_rate"] = round(bucket["down"] / rated, 4) if rated else None
+        return {
+            "since": since,
+            "until": until,
+            "turns": sum(b["turns"] for b in by_agent.values()),
+            "by_agent": by_agent,
+        }
+
+    def import_jsonl(self, path: Path, batch_size: int = 1000) -> int:
+        inserted = 0
+        batch: List[Dict[str, Any]] = []
+        for record in read_jsonl(path):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                inserted += self.insert_many(batch)
+                batch = []
+        return inserted + self.insert_many(batch)
+
+def read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    """Records of a feedback log, plain or .gz; blank and corrupt lines are skipped."""
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+_store: Optional[FeedbackStore] = None
+_store_lock = threading.Lock()
+
+def get_feedback_store() -> Optional[FeedbackStore]:
+    global _store
+    if not FEEDBACK_DB_PATH:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FeedbackStore(FEEDBACK_DB_PATH)
+    return _store
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import feedback JSONL logs (plain or .gz) into the SQLite feedback store.")
+    parser.add_argument("paths", nargs="+", type=Path)
+    parser.add_argument("--db", default=FEEDBACK_DB_PATH or ".cache/feedback.sqlite3")
+    args = parser.parse_args()
+
+    store = FeedbackStore(args.db)
+    for path in args.paths:
+        print(f"{path}: {store.import_jsonl(path)} new rows")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import atexit
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import orjson
+
+Record = Dict[str, Any]
+
+class BatchedLogWriter:
+    """JSONL writer that never blocks the caller.
+
+    ``write`` only enqueues. A daemon thread drains the queue and commits a
+    group of records with a single write once ``flush_every`` records are
+    waiting or ``flush_interval_ms`` has passed. The file rotates by size or
+    age, and rotated segments can be gzipped in the background.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        flush_every: int = 64,
+        flush_interval_ms: float = 200.0,
+        max_bytes: int = 0,
+        rotate_seconds: float = 0.0,
+        gzip_rotated: bool = True,
+        max_queue: int = 100_000,
+    ):
+        self.path = Path(path)
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = max(0.001, flush_interval_ms / 1000.0)
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.gzip_rotated = gzip_rotated
+        self._queue: "queue.Queue[Optional[Record]]" = queue.Queue(maxsize=max_queue)
+        self._sinks: List[Callable[[List[Record]], None]] = []
+        self._flushed = threading.Condition()
+        self._pending = 0
+        self._opened_at = time.time()
+        self.dropped = 0
+        self.written = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="feedback-log-writer", daemon=True)
+        self._thread.start()
+
+    def add_sink(self, sink: Callable[[List[Record]], None]) -> None:
+        """Extra consumer called with every committed batch, on the writer thread."""
+        self._sinks.append(sink)
+
+    def write(self, record: Record) -> None:
+        if self._closed:
+            return
+        with self._flushed:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # shed load rather than block the request path
+            with self._flushed:
+                self._pending -= 1
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        deadline = time.time() + timeout
+        with self._flushed:
+            while self._pending > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._flushed.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self._opened_at = self.path.stat().st_mtime
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stop = self._fill(batch)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _fill(self, batch: List[Record]) -> bool:
+        """Top up the batch until it is full or the flush interval runs out.
+        Returns True when the close sentinel was seen."""
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.flush_every:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return False
+            if item is None:
+                return True
+            batch.append(item)
+        return False
+
+    def _commit(self, batch: List[Record]) -> None:
+        try:
+            self._maybe_rotate()
+            data = b"".join(orjson.dumps(r, default=str, option=orjson.OPT_APPEND_NEWLINE) for r in batch)
+            with self.path.open("ab") as f:
+                f.write(data)
+            self.written += len(batch)
+            for sink in self._sinks:
+                try:
+                    sink(batch)
+                except Exception:
+                    pass
+        except Exception:
+            self.dropped += len(batch)
+        finally:
+            with self._flushed:
+                self._pending -= len(batch)
+                self._flushed.notify_all()
+
+    def _maybe_rotate(self) -> None:
+        if not self.path.exists():
+            self._opened_at = time.time()
+            return
+        too_big = self.max_bytes and self.path.stat().st_size >= self.max_bytes
+        too_old = self.rotate_seconds and time.time() - self._opened_at >= self.rotate_seconds
+        if not (too_big or too_old):
+            return
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        os.replace(self.path, rotated)
+        self._opened_at = time.time()
+        if self.gzip_rotated:
+            threading.Thread(target=_gzip_file, args=(rotated,), name="feedback-log-gzip", daemon=True).start()
+
+def _gzip_file(path: Path) -> None:
+    target = path.with_name(path.name + ".gz")
+    with path.open("rb") as src, gzip.open(target, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    path.unlink()
+
+_writer: Optional[BatchedLogWriter] = None
+_writer_lock = threading.Lock()
+
+def get_log_writer(path: Path, sinks: Sequence[Callable[[List[Record]], None]] = ()) -> BatchedLogWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = BatchedLogWriter(
+                    path,
+                    flush_every=int(os.getenv("FEEDBACK_LOG_FLUSH_EVERY", "64")),
+                    flush_interval_ms=float(os.getenv("FEEDBACK_LOG_FLUSH_MS", "200")),
+                    max_bytes=int(os.getenv("FEEDBACK_LOG_MAX_BYTES", str(64 * 1024 * 1024))),
+                    rotate_seconds=float(os.getenv("FEEDBACK_LOG_ROTATE_SECONDS", "0")),
+                    gzip_rotated=os.getenv("FEEDBACK_LOG_GZIP", "1") == "1",
+                )
+                for sink in sinks:
+                    _writer.add_sink(sink)
+                atexit.register(_writer.close)
+    return _writer
+
+def close_log_writer() -> None:
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
@@ -1,36 +1,75 @@
-from typing import Optional, TypedDict
+from typing import Any, Dict, Optional, TypedDict
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
+from pydantic import BaseModel
 
-from app.agents.agent_1_image_issue import agent_1_node
-from app.agents.agent_2_faq import agent_2_node
-from app.agents.fallback_clarifier import fallback_node
+from app.agents.agent_1_image_issue import agent_1_node, agent_1_node_async
+from app.agents.agent_2_faq import agent_2_node, agent_2_node_async
+from app.agents.fallback_clarifier import fallback_node, fallback_node_async
 from app.feedback.feedback_logger import log_feedback
-from app.memory.session_memory import update_memory
-from app.router import classify_input
+from app.memory.conversation import load_context, record_turn
+from app.router import classify_input, looks_like_followup
+from app.services.event_stream import emit
+from app.services.intent_classifier import INTENT_CONFIDENCE_THRESHOLD, get_intent_classifier
+from app.services.tracing import traced
 
 class GraphState(TypedDict, total=False):
     session_id: str
+    turn_id: str
     image: Optional[bytes]
     text: Optional[str]
     location: Optional[str]
     caption: Optional[str]
     agent: Optional[str]   # "agent_1" | "agent_2" | "fallback"
     response: Optional[str]
+    data: Optional[BaseModel]  # the completion validated against the agent's schema, parsed once
     feedback: Optional[str]  # user rating/comment
+    cache_bypass: Optional[bool]  # skip response-cache lookups for this turn
+    cache_hit: Optional[bool]
+    history: Optional[str]  # token-budgeted summary of earlier turns
+    last_agent: Optional[str]
+    last_caption: Optional[str]
+    followup: Optional[bool]  # routed by conversation context, not keywords
+    intent: Optional[Dict[str, Any]]  # local classifier verdict: agent, confidence
+    redispatch: Optional[str]  # agent the clarifier is confident can answer right away
 
 def router_node(state: GraphState) -> GraphState:
     image = state.get("image")
     text = (state.get("text") or "").strip()
+    try:
+        state.update(load_context(state.get("session_id")))
+    except Exception:
+        pass
     if image:
         state["agent"] = "agent_1"
     else:
         state["agent"] = classify_input(text) or "fallback"
+        classifier = get_intent_classifier() if state["agent"] == "fallback" and text else None
+        if classifier is not None:
+            prediction = classifier.predict(text)
+            state["intent"] = {"agent": prediction.agent, "confidence": prediction.confidence}
+            # only low-confidence inputs go on to the LLM clarifier
+            if prediction.agent in {"agent_1", "agent_2"} and prediction.confidence >= INTENT_CONFIDENCE_THRESHOLD:
+                state["agent"] = prediction.agent
+        # "It's near the bathroom" has no keywords but continues the previous topic; "thanks" or
+        # "what?" does not, and goes to the clarifier like any other unclear message
+        last_agent = state.get("last_agent")
+        if state["agent"] == "fallback" and text and last_agent in {"agent_1", "agent_2"}:
+            leaning = (state.get("intent") or {}).get("agent") == last_agent  # the classifier, unsure, agrees
+            if leaning or looks_like_followup(text):
+                state["agent"] = last_agent
+                state["followup"] = True
+    emit("agent", {"agent": state["agent"]})
     return state
 
 def agent_dispatcher(state: GraphState) -> str:
     agent = state.get("agent") or "fallback"
     return agent if agent in {"agent_1", "agent_2", "fallback"} else "fallback"
 
+def fallback_dispatcher(state: GraphState) -> str:
+    target = state.get("redispatch")
+    return target if target in {"agent_1", "agent_2"} else "logmem"
+
 def feedback_node(state: GraphState) -> GraphState:
     # best-effort logging + memory
     try: 
@@ -40,20 +79,25 @@ def feedback_node(state: GraphState) -> GraphState:
     try:
         sid = state.get("session_id")
         if sid: 
-            update_memory(sid, state)
+            record_turn(sid, state)
     except Exception: pass
     return state
 
 def build_graph():
     builder = StateGraph(GraphState)
 
-    builder.add_node("router", router_node)
-    builder.add_node("agent_1", agent_1_node)
-    builder.add_node("agent_2", agent_2_node)
-    builder.add_node("fallback", fallback_node)
+    builder.add_node("router", traced("node.router")(router_node))
+    # sync funcs serve graph.invoke, async variants serve graph.ainvoke
+    for name, sync_fn, async_fn in (
+        ("agent_1", agent_1_node, agent_1_node_async),
+        ("agent_2", agent_2_node, agent_2_node_async),
+        ("fallback", fallback_node, fallback_node_async),
+    ):
+        stage = traced(f"node.{name}", agent=name)
+        builder.add_node(name, RunnableLambda(stage(sync_fn), afunc=stage(async_fn)))
 
     # IMPORTANT: do NOT name this node "feedback" because it's a state key
-    builder.add_node("logmem", feedback_node)
+    builder.add_node("logmem", traced("node.logmem")(feedback_node))
 
     builder.set_entry_point("router")
     builder.add_conditional_edges(
@@ -68,7 +112,16 @@ def build_graph():
 
     builder.add_edge("agent_1", "logmem")
     builder.add_edge("agent_2", "logmem")
-    builder.add_edge("fallback", "logmem")
+    # a confident clarifier hands straight over instead of asking the user to resend
+    builder.add_conditional_edges(
+        "fallback",
+        fallback_dispatcher,
+        {
+            "agent_1": "agent_1",
+            "agent_2": "agent_2",
+            "logmem": "logmem",
+        },
+    )
     builder.add_edge("logmem", END)
 
     return builder.compile()
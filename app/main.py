@@ -1,40 +1,276 @@
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
-from typing import Optional
+import asyncio
+import math
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Any, AsyncIterator, Dict, Optional
+from app.feedback.feedback_logger import log_rating, shutdown_feedback_log
+from app.feedback.feedback_store import get_feedback_store
 from app.langgraph_builder import build_graph
+from app.memory.session_memory import get_memory
+from app.services.admission import (
+    RATE_LIMIT_TRUST_PROXY,
+    Overloaded,
+    blip_slots,
+    check_rate_limit,
+    llm_slots,
+)
+from app.services.blip_captioner import BLIP_WARMUP, CAPTION_MODE, areadiness, awarm_up
+from app.services.event_stream import format_sse, open_event_stream
+from app.services.image_preprocess import ImageRejected, UploadLimitMiddleware, preprocess_image, read_upload
+from app.services.llm_invoker import llm_retry_after
+from app.services.llm_resilience import CircuitOpenError, LLMDeadlineExceeded
+from app.services.metrics import CONTENT_TYPE, render_metrics
+from app.services.prompt_loader import get_registry
+from app.services.token_accounting import warm_tokenizer
+from app.services.tracing import ServerTimingMiddleware, span
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="Real Estate Bot")
+async def _background_warm_up() -> None:
+    try:
+        await awarm_up()
+    except Exception:
+        pass  # recorded in model_status(); /ready reports it
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_registry()  # compile every prompt template before the first request
+    # may download the BPE file; token counts use the character estimate until it is loaded
+    asyncio.get_running_loop().run_in_executor(None, warm_tokenizer)
+    # in worker mode the caption worker owns (and warms) the model
+    if CAPTION_MODE != "worker" and BLIP_WARMUP == "blocking":
+        await awarm_up()
+    elif CAPTION_MODE != "worker" and BLIP_WARMUP == "background":
+        asyncio.ensure_future(_background_warm_up())
+    yield
+    # flush whatever the log writer still has queued before the worker exits
+    await asyncio.get_running_loop().run_in_executor(None, shutdown_feedback_log)
+
+app = FastAPI(title="Real Estate Bot", lifespan=lifespan)
+# innermost, so a 413 still carries the CORS and Server-Timing headers
+app.add_middleware(UploadLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://*.streamlit.app","https://fatakpay.streamlit.app"],
     allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(ServerTimingMiddleware)
 _graph = build_graph()
 
-@app.post("/chat")
-async def chat(
-    session_id: str = Form(...),
-    text: Optional[str] = Form(None),
-    location: Optional[str] = Form(None),
-    feedback: Optional[str] = Form(None),
-    image: Optional[UploadFile] = File(None),
-):
-    image_bytes = await image.read() if image else None
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+@app.exception_handler(LLMDeadlineExceeded)
+async def llm_deadline_handler(request: Request, exc: LLMDeadlineExceeded):
+    # a slow upstream usually also trips the breaker; wait out its cool-down when it has
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(max(1, math.ceil(llm_retry_after())))},
+    )
 
-    state = {
+@app.exception_handler(ImageRejected)
+async def image_rejected_handler(request: Request, exc: ImageRejected):
+    return JSONResponse({"detail": exc.detail}, status_code=exc.status_code)
+
+def _client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def _admit(request: Request, session_id: str, has_image: bool) -> None:
+    # reject before reading the upload or starting the graph, so overload costs next to nothing
+    wait = check_rate_limit(session_id, _client_ip(request))
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="rate limit exceeded",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+    for limiter in ((blip_slots, llm_slots) if has_image else (llm_slots,)):
+        if limiter.saturated():
+            raise Overloaded(limiter.name, "queue_full", limiter.retry_after())
+
+async def _build_state(
+    session_id: str,
+    text: Optional[str],
+    location: Optional[str],
+    feedback: Optional[str],
+    no_cache: bool,
+    image: Optional[UploadFile],
+) -> Dict[str, Any]:
+    image_bytes = None
+    if image is not None:
+        raw = await read_upload(image)
+        if raw:
+            # only the downscaled JPEG goes into the graph state; the original is dropped here
+            with span("image.preprocess"):
+                image_bytes = await asyncio.get_running_loop().run_in_executor(None, preprocess_image, raw)
+
+    return {
         "session_id": session_id,
+        "turn_id": uuid.uuid4().hex,
         "text": text,
         "location": location,
         "feedback": feedback,
         "image": image_bytes,
+        "cache_bypass": no_cache,
     }
 
-    result = _graph.invoke(state)
-
-    payload = {
+def _payload(result: Dict[str, Any]) -> Dict[str, Any]:
+    data = result.get("data")
+    return {
         "agent": result.get("agent"),
         "caption": result.get("caption"),
         "response": result.get("response"),
+        "data": data.dict() if data is not None else None,
+        "turn_id": result.get("turn_id"),
     }
-    return JSONResponse(payload)
\ No newline at end of file
+
+RATINGS = ("up", "down")
+
+async def _legacy_rating(session_id: str, rating: str) -> Dict[str, Any]:
+    # older clients rate by posting an empty /chat turn; apply it to the session's last turn instead
+    last = await asyncio.get_running_loop().run_in_executor(None, get_memory, session_id)
+    turn_id = last.get("turn_id")
+    if turn_id:
+        log_rating(session_id, turn_id, rating)
+    return {"agent": None, "caption": None, "response": None, "data": None, "turn_id": turn_id}
+
+@app.post("/chat")
+async def chat(
+    request: Request,
+    session_id: str = Form(...),
+    text: Optional[str] = Form(None),
+    location: Optional[str] = Form(None),
+    feedback: Optional[str] = Form(None),
+    no_cache: bool = Form(False),
+    image: Optional[UploadFile] = File(None),
+):
+    if feedback in RATINGS and not (text or "").strip() and image is None:
+        return JSONResponse(await _legacy_rating(session_id, feedback))
+    _admit(request, session_id, image is not None)
+    state = await _build_state(session_id, text, location, feedback, no_cache, image)
+
+    result = await _graph.ainvoke(state)
+
+    return JSONResponse(_payload(result))
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: Request,
+    session_id: str = Form(...),
+    text: Optional[str] = Form(None),
+    location: Optional[str] = Form(None),
+    feedback: Optional[str] = Form(None),
+    no_cache: bool = Form(False),
+    image: Optional[UploadFile] = File(None),
+):
+    """Server-Sent Events: `agent` and `caption` as soon as they are known,
+    `token` deltas while the LLM generates, then `done` with the /chat payload."""
+    _admit(request, session_id, image is not None)
+    state = await _build_state(session_id, text, location, feedback, no_cache, image)
+
+    async def events() -> AsyncIterator[str]:
+        with open_event_stream() as queue:
+            run = asyncio.ensure_future(_graph.ainvoke(state))
+        next_event: Optional["asyncio.Future[Any]"] = None
+        try:
+            while True:
+                next_event = asyncio.ensure_future(queue.get())
+                await asyncio.wait({next_event, run}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_event.done():
+                    next_event.cancel()
+                    break
+                yield format_sse(*next_event.result())
+            while not queue.empty():
+                yield format_sse(*queue.get_nowait())
+            try:
+                result = run.result()
+            except Exception as exc:
+                yield format_sse("error", {"detail": str(exc) or exc.__class__.__name__})
+                return
+            yield format_sse("done", _payload(result))
+        finally:
+            # client went away mid-stream: stop paying for the LLM call and drop the pending queue read
+            for task in (run, next_event):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/feedback", status_code=202)
+async def rate_turn(
+    session_id: str = Form(...),
+    turn_id: str = Form(..., max_length=64),
+    rating: str = Form(...),
+):
+    """Rate a turn by the `turn_id` /chat returned; only queues a log record, no model runs."""
+    if rating not in RATINGS:
+        raise HTTPException(status_code=422, detail=f"rating must be one of {', '.join(RATINGS)}")
+    log_rating(session_id, turn_id, rating)
+    return {"status": "queued", "turn_id": turn_id}
+
+def _check_admin(token: Optional[str]) -> None:
+    expected = os.getenv("ADMIN_TOKEN")
+    if expected and token != expected:
+        raise HTTPException(status_code=401, detail="invalid admin token")
+
+def _parse_ts(value: Optional[str], default: datetime) -> str:
+    if not value:
+        return default.isoformat()
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"not an ISO-8601 timestamp: {value}")
+
+@app.get("/admin/feedback/stats")
+async def feedback_stats(
+    since: Optional[str] = Query(None, description="ISO-8601, default 7 days ago (UTC)"),
+    until: Optional[str] = Query(None, description="ISO-8601, default now (UTC)"),
+    agent: Optional[str] = Query(None),
+    x_admin_token: Optional[str] = Header(None),
+):
+    _check_admin(x_admin_token)
+    store = get_feedback_store()
+    if store is None:
+        raise HTTPException(status_code=503, detail="feedback store disabled (set FEEDBACK_DB_PATH)")
+    now = datetime.utcnow()
+    start = _parse_ts(since, now - timedelta(days=7))
+    end = _parse_ts(until, now)
+    stats = await asyncio.get_running_loop().run_in_executor(None, store.stats, start, end, agent)
+    return JSONResponse(stats)
+
+@app.get("/metrics")
+async def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 while BLIP is still warming up (BLIP_WARMUP=background), failed to
+    load, or (CAPTION_MODE=worker) the caption worker is not ready."""
+    ok, status = await areadiness()
+    return JSONResponse({"ready": ok, "blip": status}, status_code=200 if ok else 503)
@@ -0,0 +1,104 @@
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from app.memory.session_memory import get_memory, update_memory
+from app.services.token_accounting import count_tokens
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "300"))
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "3"))
+
+# per-turn keys that are derived from the conversation, not part of it
+_DERIVED_KEYS = {"history", "last_agent", "last_caption", "followup", "intent", "redispatch", "data"}
+_GIST_KEYS = {"agent_1": "issue", "agent_2": "answer", "fallback": "clarifying_question"}
+
+def estimate_tokens(text: str) -> int:
+    return count_tokens(text)
+
+def _clip(text: str, max_chars: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= max_chars else text[: max_chars - 1].rstrip() + "…"
+
+def _gist(agent: Optional[str], data: Any, response: Optional[str]) -> str:
+    raw = (response or "").strip()
+    value = getattr(data, _GIST_KEYS.get(agent or "", ""), None)
+    if isinstance(value, str) and value:
+        raw = value
+    first_sentence = re.split(r"(?<=[.!?])\s", raw.strip(), maxsplit=1)[0]
+    return _clip(first_sentence, 160)
+
+def _turn_line(turn: Dict[str, Any]) -> str:
+    user = turn.get("user") or ("[photo]" if turn.get("caption") else "")
+    if turn.get("caption"):
+        user = f"{user} (photo: {turn['caption']})".strip()
+    return f"User: {user} -> {turn.get('agent')}: {turn.get('gist')}"
+
+def _fold(turn: Dict[str, Any]) -> str:
+    # the summary keeps only what was asked and where it was routed
+    return f"{_clip(turn.get('user') or turn.get('caption') or '', 60)} [{turn.get('agent')}]"
+
+def render_history(conversation: Optional[Dict[str, Any]]) -> str:
+    if not conversation:
+        return ""
+    lines: List[str] = []
+    if conversation.get("summary"):
+        lines.append(f"Earlier: {conversation['summary']}")
+    lines.extend(_turn_line(t) for t in conversation.get("turns", []))
+    return "\n".join(lines)
+
+def update_conversation(conversation: Optional[Dict[str, Any]], state: Dict[str, Any]) -> Dict[str, Any]:
+    """Append this turn and fold the oldest turns into the summary until the
+    rendered history fits the token budget. Each call touches only the turns
+    that overflow, so the cost doesn't grow with conversation length."""
+    conversation = dict(conversation or {})
+    turns = list(conversation.get("turns", []))
+    summary = conversation.get("summary", "")
+    turns.append({
+        "user": _clip(state.get("text") or "", 200),
+        "caption": state.get("caption"),
+        "agent": state.get("agent"),
+        "gist": _gist(state.get("agent"), state.get("data"), state.get("response")),
+    })
+
+    def over_budget() -> bool:
+        rendered = render_history({"summary": summary, "turns": turns})
+        return estimate_tokens(rendered) > HISTORY_TOKEN_BUDGET
+
+    while turns and (len(turns) > HISTORY_RECENT_TURNS or over_budget()):
+        folded = _fold(turns.pop(0))
+        summary = f"{summary}; {folded}" if summary else folded
+        # the summary gets at most half the budget; drop its oldest entries first
+        while estimate_tokens(summary) > HISTORY_TOKEN_BUDGET // 2 and "; " in summary:
+            summary = summary.split("; ", 1)[1]
+        if estimate_tokens(summary) > HISTORY_TOKEN_BUDGET // 2:
+            summary = _clip(summary, HISTORY_TOKEN_BUDGET * 2)
+
+    conversation.update({
+        "summary": summary,
+        "turns": turns,
+        "last_agent": state.get("agent"),
+        "last_caption": state.get("caption") or conversation.get("last_caption"),
+    })
+    return conversation
+
+def load_context(session_id: Optional[str]) -> Dict[str, Any]:
+    """Fields the router and agent prompts need from previous turns."""
+    if not session_id:
+        return {}
+    conversation = get_memory(session_id).get("conversation")
+    if not conversation:
+        return {}
+    return {
+        "history": render_history(conversation),
+        "last_agent": conversation.get("last_agent"),
+        "last_caption": conversation.get("last_caption"),
+    }
+
+def record_turn(session_id: str, state: Dict[str, Any]) -> None:
+    previous = get_memory(session_id)
+    conversation = previous.get("conversation")
+    if (state.get("text") or "").strip() or state.get("image"):
+        conversation = update_conversation(conversation, state)
+    record = {k: v for k, v in state.items() if k not in _DERIVED_KEYS}
+    record["conversation"] = conversation or {}
+    update_memory(session_id, record)
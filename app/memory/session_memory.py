@@ -1,18 +1,173 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
 import threading
+import time
 
-_memory_store: Dict[str, Dict[str, Any]] = {}
-_lock = threading.Lock()
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory")  # "memory" | "sqlite"
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", ".cache/sessions.sqlite3")
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(32 * 1024 * 1024)))
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "3600"))
+
+def _sanitize(state: Dict[str, Any]) -> str:
+    # raw uploads never go into the store, only a hash to recognise the same photo
+    data = dict(state)
+    image = data.pop("image", None)
+    if image:
+        data["image_sha256"] = hashlib.sha256(image).hexdigest()
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+class SessionStore:
+    def get(self, session_id: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+class InProcessSessionStore(SessionStore):
+    """LRU dict bounded by entry count and serialized bytes, with idle-TTL expiry."""
+
+    def __init__(self, max_entries: int, max_bytes: int, idle_ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        # session_id -> (serialized state, last access); ordered oldest access first
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return {}
+            self._entries[session_id] = (entry[0], now)
+            self._entries.move_to_end(session_id)
+        return json.loads(entry[0])
+
+    def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        payload = _sanitize(state)
+        now = time.time()
+        with self._lock:
+            self._drop(session_id)
+            self._entries[session_id] = (payload, now)
+            self._bytes += len(payload)
+            self._expire(now)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._drop(session_id)
+
+    def _drop(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def _expire(self, now: float) -> None:
+        while self._entries:
+            oldest, (_, last_access) = next(iter(self._entries.items()))
+            if now - last_access <= self.idle_ttl:
+                break
+            self._drop(oldest)
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a WAL-mode SQLite file, shared by every uvicorn worker on the host."""
+
+    _ENFORCE_EVERY = 32  # writes between eviction passes
+
+    def __init__(self, db_path: str, max_entries: int, max_bytes: int, idle_ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access)")
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ? AND last_access >= ?",
+                (session_id, now - self.idle_ttl),
+            ).fetchone()
+            if row is None:
+                return {}
+            self._conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        return json.loads(row[0])
+
+    def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        payload = _sanitize(state)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, size, last_access) VALUES (?, ?, ?, ?)",
+                (session_id, payload, len(payload), time.time()),
+            )
+            self._writes += 1
+            if self._writes % self._ENFORCE_EVERY == 0:
+                self._enforce_limits()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _enforce_limits(self) -> None:
+        self._conn.execute("DELETE FROM sessions WHERE last_access < ?", (time.time() - self.idle_ttl,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # walk oldest-first until both budgets fit, then delete that prefix in one statement
+        cutoff = None
+        for session_id, size, last_access in self._conn.execute(
+            "SELECT session_id, size, last_access FROM sessions ORDER BY last_access"
+        ):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            count -= 1
+            total -= size
+            cutoff = last_access
+        if cutoff is not None:
+            self._conn.execute("DELETE FROM sessions WHERE last_access <= ?", (cutoff,))
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+def get_session_store() -> SessionStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if SESSION_STORE_BACKEND == "sqlite":
+                    _store = SQLiteSessionStore(
+                        SESSION_DB_PATH, SESSION_MAX_ENTRIES, SESSION_MAX_BYTES, SESSION_IDLE_TTL_SECONDS
+                    )
+                else:
+                    _store = InProcessSessionStore(SESSION_MAX_ENTRIES, SESSION_MAX_BYTES, SESSION_IDLE_TTL_SECONDS)
+    return _store
 
 def get_memory(session_id: str) -> Dict[str, Any]:
-    with _lock:
-        return _memory_store.get(session_id, {}).copy()
+    return get_session_store().get(session_id)
 
 def update_memory(session_id: str, state: Dict[str, Any]) -> None:
-    with _lock:
-        _memory_store[session_id] = state.copy()
+    get_session_store().put(session_id, state)
 
 def clear_memory(session_id: str) -> None:
-    with _lock:
-        if session_id in _memory_store:
-            del _memory_store[session_id]
\ No newline at end of file
+    get_session_store().delete(session_id)
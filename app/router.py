@@ -1,9 +1,10 @@
-from typing import Literal
+import re
+from typing import Dict, List, Literal, NamedTuple, Tuple
 
 ISSUE_KWS = {
     "mold", "mould", "leak", "leaking", "damp", "moisture", "crack", "cracks",
     "peel", "peeling", "paint", "fixture", "tap", "faucet", "toilet", "drain",
-    "stain", "stains", "ceiling", "wall", "tile", "tiles", "window", "door",
+    "stain", "stains", "ceiling", "wall", "tile", "tiles", "window", "door", "plug",
 }
 FAQ_KWS = {
     "notice", "evict", "eviction", "deposit", "rent", "increase", "agreement",
@@ -13,12 +14,82 @@ FAQ_KWS = {
 
 AgentName = Literal["agent_1", "agent_2", "fallback"]
 
+# whole words only ("rent" must not fire on "current", nor "tap" on "tapestry"),
+# but accept the common inflections and derived forms so "walls", "terminated",
+# "tiling", "dampness", "leakage" or "paintwork" still count
+_SUFFIXES = ("", "s", "es", "ed", "ing", "y", "er", "ers", "ness", "age", "work")
+# a final "e" is dropped before a vowel ("tile" -> "tiling") and takes a bare "d" ("tile" -> "tiled")
+_E_SUFFIXES = ("ing", "y", "er", "ers", "age")
+# compounds written as one word ("windowsill", "doorframe", "wallpaper")
+_COMPOUNDS = ("sill", "sills", "frame", "frames", "paper")
+# one-syllable words ending consonant-vowel-consonant double it ("tap" -> "tapped", "plug" -> "plugging")
+_DOUBLING = re.compile(r"^[^aeiou]*[aeiou][^aeiouwxy]$")
+_DOUBLED_SUFFIXES = ("ed", "ing", "er", "ers")
+
+def _forms(kw: str) -> List[str]:
+    forms = [kw + suffix for suffix in _SUFFIXES + _COMPOUNDS]
+    if kw.endswith("e"):
+        forms.append(kw + "d")
+        forms.extend(kw[:-1] + suffix for suffix in _E_SUFFIXES)
+    elif kw.endswith("y"):  # "tenancy" -> "tenancies"
+        forms.append(kw[:-1] + "ies")
+    elif _DOUBLING.match(kw):
+        forms.extend(kw + kw[-1] + suffix for suffix in _DOUBLED_SUFFIXES)
+    return forms
+
+def _build_lexicon() -> Dict[str, Tuple[str, str]]:
+    lexicon: Dict[str, Tuple[str, str]] = {}
+    # issue keywords are written last so they win any shared inflection, like the old priority
+    for cls, words in (("agent_2", FAQ_KWS), ("agent_1", ISSUE_KWS)):
+        for kw in words:
+            for form in _forms(kw):
+                lexicon[form] = (cls, kw)
+    for kw in ISSUE_KWS | FAQ_KWS:  # an exact keyword always maps to itself
+        lexicon[kw] = ("agent_1" if kw in ISSUE_KWS else "agent_2", kw)
+    return lexicon
+
+# a single compiled tokenizer pass plus O(1) lookups per word, instead of
+# scanning the text once per keyword
+_LEXICON = _build_lexicon()
+_ISSUE_FORMS = frozenset(w for w, (cls, _) in _LEXICON.items() if cls == "agent_1")
+_FAQ_FORMS = frozenset(w for w, (cls, _) in _LEXICON.items() if cls == "agent_2")
+_WORD_RE = re.compile(r"[a-z]+")
+
+class KeywordHits(NamedTuple):
+    counts: Dict[str, int]
+    positions: Dict[str, List[Tuple[int, str]]]  # (offset, matched keyword) per class
+
+def match_keywords(text: str) -> KeywordHits:
+    positions: Dict[str, List[Tuple[int, str]]] = {"agent_1": [], "agent_2": []}
+    lexicon = _LEXICON
+    for m in _WORD_RE.finditer((text or "").lower()):
+        hit = lexicon.get(m.group())
+        if hit is not None:
+            positions[hit[0]].append((m.start(), hit[1]))
+    return KeywordHits({cls: len(hits) for cls, hits in positions.items()}, positions)
+
 def classify_input(text: str) -> AgentName:
     t = (text or "").lower()
     if not t:
         return "fallback"
-    if any(kw in t for kw in ISSUE_KWS):
+    # routing only needs yes/no per class: set intersections, no positions
+    words = set(_WORD_RE.findall(t))
+    if not _ISSUE_FORMS.isdisjoint(words):
         return "agent_1"
-    if any(kw in t for kw in FAQ_KWS):
+    if not _FAQ_FORMS.isdisjoint(words):
         return "agent_2"
-    return "fallback"
\ No newline at end of file
+    return "fallback"
+
+# a keyword-less message only continues the previous topic when it points back at it
+_REFERENCES = frozenset({"it", "its", "that", "this", "these", "those", "they", "them", "same", "also", "again"})
+_CONTINUATIONS = frozenset({("and",), ("but",), ("also",), ("what", "about"), ("how", "about"), ("what", "if")})
+_SMALL_TALK = frozenset({"hi", "hello", "hey", "thanks", "thank", "thx", "ok", "okay", "cheers", "bye", "great", "cool"})
+
+def looks_like_followup(text: str) -> bool:
+    """True for "It's near the bathroom" or "what about the deposit?", not for "hello" or "thanks"."""
+    words = _WORD_RE.findall((text or "").lower())
+    if not words or words[0] in _SMALL_TALK:
+        return False
+    if (words[0],) in _CONTINUATIONS or tuple(words[:2]) in _CONTINUATIONS:
+        return True
+    return not _REFERENCES.isdisjoint(words)
@@ -0,0 +1,174 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Tuple
+
+from app.services.metrics import counter, gauge
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_SESSION_PER_MIN = float(os.getenv("RATE_LIMIT_SESSION_PER_MIN", "30"))
+RATE_LIMIT_SESSION_BURST = float(os.getenv("RATE_LIMIT_SESSION_BURST", "10"))
+RATE_LIMIT_IP_PER_MIN = float(os.getenv("RATE_LIMIT_IP_PER_MIN", "120"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "30"))
+# only trust X-Forwarded-For behind a proxy that overwrites it
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1"
+
+ADMISSION_BLIP_SLOTS = int(os.getenv("ADMISSION_BLIP_SLOTS", "16"))
+ADMISSION_BLIP_QUEUE = int(os.getenv("ADMISSION_BLIP_QUEUE", "32"))
+ADMISSION_LLM_SLOTS = int(os.getenv("ADMISSION_LLM_SLOTS", "64"))
+ADMISSION_LLM_QUEUE = int(os.getenv("ADMISSION_LLM_QUEUE", "128"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+
+_rate_limited = counter("rate_limited_total", "Requests rejected with 429 by the token buckets", ["scope"])
+_rejected = counter("admission_rejected_total", "Work rejected with 503 by a resource limiter", ["resource", "reason"])
+_in_flight = gauge("admission_in_flight", "Callers currently holding a resource slot", ["resource"])
+_queue_depth = gauge("admission_queue_depth", "Callers waiting for a resource slot", ["resource"])
+
+class Overloaded(Exception):
+    """A backend resource is saturated; the caller should retry after ``retry_after`` seconds."""
+
+    def __init__(self, resource: str, reason: str, retry_after: float):
+        super().__init__(f"{resource} is overloaded ({reason})")
+        self.resource = resource
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TokenBucketLimiter:
+    """Per-key token buckets, refilled lazily on access.
+
+    Buckets idle long enough to be full again are indistinguishable from
+    new ones, so the key map is an LRU capped at ``max_keys``.
+    """
+
+    def __init__(self, per_minute: float, burst: float, max_keys: int = 100_000):
+        self.rate = per_minute / 60.0
+        self.burst = max(1.0, burst)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        """Take a token for ``key``. Returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1.0:
+                tokens -= 1.0
+            else:
+                wait = (1.0 - tokens) / self.rate if self.rate > 0 else 60.0
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def refund(self, key: str) -> None:
+        """Give back the token ``acquire`` just took, when a later check rejected the request anyway."""
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(self.burst, tokens + 1.0), updated)
+
+class ConcurrencyLimiter:
+    """At most ``slots`` concurrent holders, at most ``max_queue`` waiters.
+
+    Anything beyond that is rejected immediately instead of queueing, and
+    waiters give up after ``max_wait`` seconds. Slots are handed directly
+    to the oldest waiter on release so late arrivals cannot barge in.
+    Lives on the event loop; not thread-safe.
+    """
+
+    def __init__(self, name: str, slots: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.slots = max(1, slots)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._hold_seconds = 1.0  # EWMA of how long a slot is held, for Retry-After
+        _in_flight.set_function(lambda: self.in_flight, resource=name)
+        _queue_depth.set_function(lambda: self.waiting, resource=name)
+
+    @property
+    def waiting(self) -> int:
+        # O(1): a waiter leaves the deque as soon as it is handed a slot, times out or is cancelled
+        return len(self._waiters)
+
+    def retry_after(self) -> float:
+        return max(1.0, math.ceil(self._hold_seconds * (self.waiting + 1) / self.slots))
+
+    def saturated(self) -> bool:
+        return self.in_flight >= self.slots and self.waiting >= self.max_queue
+
+    def _reject(self, reason: str) -> Overloaded:
+        _rejected.inc(resource=self.name, reason=reason)
+        return Overloaded(self.name, reason, self.retry_after())
+
+    async def _acquire(self) -> None:
+        if self.in_flight < self.slots and not self.waiting:
+            self.in_flight += 1
+            return
+        if self.waiting >= self.max_queue:
+            raise self._reject("queue_full")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except BaseException as exc:
+            if waiter.done() and not waiter.cancelled():
+                self._release()  # the slot was handed over just as we gave up
+            else:
+                waiter.cancel()
+            if isinstance(exc, asyncio.TimeoutError):
+                raise self._reject("queue_timeout") from None
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def _release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # in_flight stays the same: the slot changes hands
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self._acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._hold_seconds += 0.1 * ((time.monotonic() - started) - self._hold_seconds)
+            self._release()
+
+blip_slots = ConcurrencyLimiter("blip", ADMISSION_BLIP_SLOTS, ADMISSION_BLIP_QUEUE, ADMISSION_MAX_WAIT_SECONDS)
+llm_slots = ConcurrencyLimiter("llm", ADMISSION_LLM_SLOTS, ADMISSION_LLM_QUEUE, ADMISSION_MAX_WAIT_SECONDS)
+
+_session_buckets = TokenBucketLimiter(RATE_LIMIT_SESSION_PER_MIN, RATE_LIMIT_SESSION_BURST)
+_ip_buckets = TokenBucketLimiter(RATE_LIMIT_IP_PER_MIN, RATE_LIMIT_IP_BURST)
+
+def check_rate_limit(session_id: str, client_ip: str) -> float:
+    """Seconds the caller must wait, or 0 if admitted by both the client IP and session buckets."""
+    if not RATE_LIMIT_ENABLED:
+        return 0.0
+    ip_key = f"ip:{client_ip}"
+    wait = _ip_buckets.acquire(ip_key)
+    if wait:
+        _rate_limited.inc(scope="ip")
+        return wait
+    wait = _session_buckets.acquire(f"session:{session_id}")
+    if wait:
+        # a session-level rejection must not also spend the caller's IP budget
+        _ip_buckets.refund(ip_key)
+        _rate_limited.inc(scope="session")
+    return wait
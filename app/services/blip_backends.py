@@ -0,0 +1,175 @@
+"""Interchangeable BLIP captioning backends, selected with BLIP_BACKEND.
+
+    torch       fp32 PyTorch, on CUDA when available (the original behaviour)
+    torch-int8  dynamic int8 quantization of every nn.Linear, CPU only
+    onnx        vision encoder and text decoder exported to ONNX, greedy
+                decoding driven from numpy through ONNX Runtime
+
+The ONNX graphs are exported on first use into BLIP_ONNX_DIR; run
+``python -m app.services.blip_backends --export`` at build time to keep
+that off the first request. torch and transformers are imported when a
+backend is built, so processes that never caption never import them.
+"""
+import argparse
+import os
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+BLIP_MODEL_NAME = os.getenv("BLIP_MODEL_NAME", "Salesforce/blip-image-captioning-base")
+BLIP_BACKEND = os.getenv("BLIP_BACKEND", "torch")
+# 0 keeps the library default (one thread per core); with several BLIP workers, cores / workers is a good start
+BLIP_NUM_THREADS = int(os.getenv("BLIP_NUM_THREADS", "0"))
+BLIP_ONNX_DIR = Path(os.getenv("BLIP_ONNX_DIR", ".cache/blip-onnx"))
+BLIP_MAX_NEW_TOKENS = 40
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+class TorchBackend:
+    def __init__(self, model_name: str = BLIP_MODEL_NAME, *, quantize: bool = False, num_threads: int = BLIP_NUM_THREADS):
+        import torch
+        from transformers import BlipForConditionalGeneration, BlipProcessor
+
+        self._torch = torch
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+        self.name = "torch-int8" if quantize else "torch"
+        self.processor = BlipProcessor.from_pretrained(model_name)
+        model = BlipForConditionalGeneration.from_pretrained(model_name).eval()
+        if quantize:
+            # weights stored as int8, activations quantized on the fly; quantized kernels are CPU-only
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.device = torch.device("cpu")
+        else:
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = model.to(self.device)
+
+    def caption(self, images: List[Image.Image]) -> List[str]:
+        # the processor resizes every image to the same square input, so a list stacks into one batch
+        inputs = self.processor(images, return_tensors="pt").to(self.device)
+        with self._torch.inference_mode():
+            out = self.model.generate(**inputs, max_new_tokens=BLIP_MAX_NEW_TOKENS)
+        return self.processor.batch_decode(out, skip_special_tokens=True)
+
+def export_onnx(model_name: str = BLIP_MODEL_NAME, export_dir: Path = BLIP_ONNX_DIR) -> None:
+    import torch
+    from transformers import BlipForConditionalGeneration
+
+    class _VisionEncoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.vision_model = model.vision_model
+
+        def forward(self, pixel_values):
+            return self.vision_model(pixel_values=pixel_values, return_dict=False)[0]
+
+    class _TextDecoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.text_decoder = model.text_decoder
+
+        def forward(self, input_ids, attention_mask, encoder_hidden_states):
+            return self.text_decoder(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                encoder_hidden_states=encoder_hidden_states,
+                return_dict=False,
+            )[0]
+
+    export_dir = Path(export_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    model = BlipForConditionalGeneration.from_pretrained(model_name).eval()
+    size = model.config.vision_config.image_size
+    pixel_values = torch.zeros(1, 3, size, size)
+    vision = _VisionEncoder(model)
+    with torch.no_grad():
+        hidden = vision(pixel_values)
+    input_ids = torch.full((1, 2), model.config.text_config.bos_token_id, dtype=torch.long)
+
+    # several workers may export at once: write under a private name, then rename into place
+    suffix = f".{os.getpid()}.tmp"
+    targets = {
+        "vision_encoder.onnx": (vision, (pixel_values,), ["pixel_values"], ["last_hidden_state"],
+                                {"pixel_values": {0: "batch"}, "last_hidden_state": {0: "batch"}}),
+        "text_decoder.onnx": (_TextDecoder(model), (input_ids, torch.ones_like(input_ids), hidden),
+                              ["input_ids", "attention_mask", "encoder_hidden_states"], ["logits"],
+                              {"input_ids": {0: "batch", 1: "seq"}, "attention_mask": {0: "batch", 1: "seq"},
+                               "encoder_hidden_states": {0: "batch"}, "logits": {0: "batch", 1: "seq"}}),
+    }
+    for filename, (module, args, inputs, outputs, axes) in targets.items():
+        tmp = export_dir / (filename + suffix)
+        torch.onnx.export(module, args, str(tmp), input_names=inputs, output_names=outputs,
+                          dynamic_axes=axes, opset_version=14, do_constant_folding=True)
+        os.replace(tmp, export_dir / filename)
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model_name: str = BLIP_MODEL_NAME, *, export_dir: Path = BLIP_ONNX_DIR,
+                 num_threads: int = BLIP_NUM_THREADS):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("BLIP_BACKEND=onnx needs onnxruntime: pip install onnxruntime")
+        from transformers import BlipConfig, BlipProcessor
+
+        export_dir = Path(export_dir)
+        vision_path, decoder_path = export_dir / "vision_encoder.onnx", export_dir / "text_decoder.onnx"
+        if not (vision_path.exists() and decoder_path.exists()):
+            export_onnx(model_name, export_dir)
+
+        text_config = BlipConfig.from_pretrained(model_name).text_config
+        self.bos_token_id = text_config.bos_token_id
+        self.eos_token_id = text_config.sep_token_id
+        self.pad_token_id = text_config.pad_token_id
+        self.processor = BlipProcessor.from_pretrained(model_name)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        providers = ["CPUExecutionProvider"]
+        self.vision = ort.InferenceSession(str(vision_path), options, providers=providers)
+        self.decoder = ort.InferenceSession(str(decoder_path), options, providers=providers)
+
+    def caption(self, images: List[Image.Image]) -> List[str]:
+        pixel_values = self.processor(images=images, return_tensors="np")["pixel_values"].astype(np.float32)
+        hidden = self.vision.run(None, {"pixel_values": pixel_values})[0]
+        batch = hidden.shape[0]
+        ids = np.full((batch, 1), self.bos_token_id, dtype=np.int64)
+        finished = np.zeros(batch, dtype=bool)
+        # greedy, like generate() with the default config; no KV cache, so each step re-reads the prefix
+        for _ in range(BLIP_MAX_NEW_TOKENS):
+            logits = self.decoder.run(None, {
+                "input_ids": ids,
+                "attention_mask": np.ones_like(ids),
+                "encoder_hidden_states": hidden,
+            })[0]
+            next_ids = np.where(finished, self.pad_token_id, logits[:, -1].argmax(-1))
+            ids = np.concatenate([ids, next_ids[:, None].astype(np.int64)], axis=1)
+            finished |= next_ids == self.eos_token_id
+            if finished.all():
+                break
+        return self.processor.batch_decode(ids, skip_special_tokens=True)
+
+def load_backend(name: str = BLIP_BACKEND):
+    if name == "torch":
+        return TorchBackend()
+    if name == "torch-int8":
+        return TorchBackend(quantize=True)
+    if name == "onnx":
+        return OnnxBackend()
+    raise ValueError(f"unknown BLIP_BACKEND {name!r}, expected one of {', '.join(BACKENDS)}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the BLIP ONNX graphs ahead of time.")
+    parser.add_argument("--export", action="store_true", required=True)
+    parser.add_argument("--out", type=Path, default=BLIP_ONNX_DIR)
+    args = parser.parse_args()
+    export_onnx(BLIP_MODEL_NAME, args.out)
+    print(f"exported to {args.out}")
+
+if __name__ == "__main__":
+    main()
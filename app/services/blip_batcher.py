@@ -0,0 +1,122 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable, List, Optional, Tuple
+
+BatchFn = Callable[[List[bytes]], List[str]]
+
+class CaptionBatcher:
+    """Collects concurrent caption requests and runs them as one model batch.
+
+    A batch is flushed once it holds ``max_batch_size`` images or the oldest
+    request has waited ``max_wait_ms``. At most ``max_concurrent_batches`` run
+    at a time; while they are busy new requests keep accumulating in the queue,
+    so batches grow with load instead of piling up in the executor.
+    """
+
+    def __init__(
+        self,
+        batch_fn: BatchFn,
+        executor: Executor,
+        *,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_concurrent_batches: int = 1,
+    ):
+        self._batch_fn = batch_fn
+        self._executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._slots = asyncio.Semaphore(max(1, max_concurrent_batches))
+        self._queue: "asyncio.Queue[Tuple[bytes, asyncio.Future]]" = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self.batches_run = 0
+        self.images_run = 0
+
+    async def caption(self, image_bytes: bytes) -> str:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_bytes, fut))
+        return await fut
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _collect(self) -> List[Tuple[bytes, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # callers that gave up while queued don't need a slot in the batch
+        return [(img, fut) for img, fut in batch if not fut.done()]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            if not batch:
+                self._slots.release()
+                continue
+            loop.create_task(self._flush(batch))
+
+    async def _flush(self, batch: List[Tuple[bytes, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            captions = await loop.run_in_executor(self._executor, self._batch_fn, [img for img, _ in batch])
+        except Exception as exc:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(exc)
+            else:
+                # one undecodable image must not fail everyone coalesced with it
+                await self._flush_singly(batch)
+        else:
+            self.batches_run += 1
+            self.images_run += len(batch)
+            for (_, fut), caption in zip(batch, captions):
+                if not fut.done():
+                    fut.set_result(caption)
+        finally:
+            self._slots.release()
+
+    async def _flush_singly(self, batch: List[Tuple[bytes, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        for img, fut in batch:
+            if fut.done():
+                continue
+            try:
+                (caption,) = await loop.run_in_executor(self._executor, self._batch_fn, [img])
+            except Exception as exc:
+                if not fut.done():
+                    fut.set_exception(exc)
+            else:
+                self.batches_run += 1
+                self.images_run += 1
+                if not fut.done():
+                    fut.set_result(caption)
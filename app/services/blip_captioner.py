@@ -1,24 +1,180 @@
-from typing import Optional
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Tuple
 from io import BytesIO
 from PIL import Image
-import torch
-from transformers import BlipProcessor, BlipForConditionalGeneration
 
-_blip_processor: Optional[BlipProcessor] = None
-_blip_model: Optional[BlipForConditionalGeneration] = None
-_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+from app.services.admission import Overloaded, blip_slots
+from app.services.blip_backends import BLIP_BACKEND, load_backend
+from app.services.blip_batcher import CaptionBatcher
+from app.services.caption_cache import get_caption_cache
+from app.services.metrics import counter, gauge
+from app.services.tracing import span
+
+_backend = None
+_backend_lock = threading.Lock()
+_status = {"state": "not_loaded", "backend": BLIP_BACKEND, "load_seconds": None, "warmup_seconds": None, "error": None}
+
+# off: load on the first image request; background: load and warm at startup while serving;
+# blocking: finish loading and warming before the worker accepts any request
+BLIP_WARMUP = os.getenv("BLIP_WARMUP", "off")
+# inprocess: the model lives in every API worker; worker: ask `python -m app.services.caption_worker`
+CAPTION_MODE = os.getenv("CAPTION_MODE", "inprocess")
+CAPTION_WORKER_FALLBACK = os.getenv("CAPTION_WORKER_FALLBACK", "1") == "1"
+BLIP_MAX_WORKERS = int(os.getenv("BLIP_MAX_WORKERS", "2"))
+BLIP_BATCHING = os.getenv("BLIP_BATCHING", "1") == "1"
+BLIP_BATCH_MAX_SIZE = int(os.getenv("BLIP_BATCH_MAX_SIZE", "8"))
+BLIP_BATCH_MAX_WAIT_MS = float(os.getenv("BLIP_BATCH_MAX_WAIT_MS", "10"))
+
+# BLIP is CPU-bound; keep it off the event loop and cap how many generates run at once
+_executor = ThreadPoolExecutor(max_workers=BLIP_MAX_WORKERS, thread_name_prefix="blip")
+_batcher: Optional[CaptionBatcher] = None
+_batcher_loop: Optional[asyncio.AbstractEventLoop] = None
+_worker_client = None
+_worker_fallbacks = counter("caption_worker_fallback_total", "Captions made in-process because the caption worker was unreachable")
+
+gauge("blip_batch_queue_depth", "Images waiting for the BLIP micro-batcher").set_function(
+    lambda: _batcher.queue_depth() if _batcher is not None else 0
+)
 
 def _ensure_blip_loaded():
-    global _blip_processor, _blip_model
-    if _blip_processor is None or _blip_model is None:
-        _blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-        _blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base").to(_device)
+    global _backend
+    if _backend is None:
+        # both BLIP worker threads can get here on the first burst; load once
+        with _backend_lock:
+            if _backend is None:
+                _status.update(state="loading", error=None)
+                started = time.perf_counter()
+                try:
+                    _backend = load_backend(BLIP_BACKEND)
+                except Exception as exc:
+                    _status.update(state="failed", error=f"{exc.__class__.__name__}: {exc}")
+                    raise
+                _status.update(state="loaded", load_seconds=round(time.perf_counter() - started, 3))
+    return _backend
+
+def warm_up() -> None:
+    # the first generate pays for allocator growth and kernel selection; do it on a throwaway image
+    backend = _ensure_blip_loaded()
+    started = time.perf_counter()
+    backend.caption([Image.new("RGB", (384, 384), (127, 127, 127))])
+    _status.update(state="ready", warmup_seconds=round(time.perf_counter() - started, 3))
+
+async def awarm_up() -> None:
+    await asyncio.get_running_loop().run_in_executor(_executor, warm_up)
+
+def model_status() -> dict:
+    return dict(_status, mode=CAPTION_MODE, warmup=BLIP_WARMUP, torch_imported="torch" in sys.modules)
+
+def is_ready() -> bool:
+    if _status["state"] == "failed":
+        return False
+    return BLIP_WARMUP == "off" or _status["state"] == "ready"
+
+def _load_images(images_bytes: List[bytes]) -> List[Image.Image]:
+    with span("blip.decode", images=len(images_bytes)):
+        return [Image.open(BytesIO(b)).convert("RGB") for b in images_bytes]
+
+def caption_images(images: List[Image.Image]) -> List[str]:
+    backend = _ensure_blip_loaded()
+    with span("blip.generate", images=len(images)):
+        captions = backend.caption(images)
+    if _status["state"] != "ready":
+        _status["state"] = "ready"
+    return captions
+
+def caption_image_batch(images_bytes: List[bytes]) -> List[str]:
+    return caption_images(_load_images(images_bytes))
+
+def _caption_uncached(image_bytes: bytes) -> str:
+    return caption_images(_load_images([image_bytes]))[0]
 
 def caption_image_bytes(image_bytes: bytes) -> str:
-    _ensure_blip_loaded()
-    image = Image.open(BytesIO(image_bytes)).convert("RGB")
-    inputs = _blip_processor(image, return_tensors="pt").to(_device)
-    with torch.no_grad():
-        out = _blip_model.generate(**inputs, max_new_tokens=40)
-    caption = _blip_processor.decode(out[0], skip_special_tokens=True)
+    cache = get_caption_cache()
+    if cache is None:
+        return _caption_uncached(image_bytes)
+    key = cache.key_for(image_bytes)
+    caption = cache.get(key)
+    if caption is None:
+        caption = _caption_uncached(image_bytes)
+        cache.put(key, caption)
+    return caption
+
+def get_batcher() -> CaptionBatcher:
+    global _batcher, _batcher_loop
+    loop = asyncio.get_running_loop()
+    if _batcher is None or _batcher_loop is not loop:
+        _batcher = CaptionBatcher(
+            caption_image_batch,
+            _executor,
+            max_batch_size=BLIP_BATCH_MAX_SIZE,
+            max_wait_ms=BLIP_BATCH_MAX_WAIT_MS,
+            max_concurrent_batches=BLIP_MAX_WORKERS,
+        )
+        _batcher_loop = loop
+    return _batcher
+
+async def _acaption_inprocess(image_bytes: bytes) -> str:
+    if BLIP_BATCHING:
+        return await get_batcher().caption(image_bytes)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _caption_uncached, image_bytes)
+
+def _get_worker_client():
+    global _worker_client
+    if _worker_client is None:
+        from app.services.caption_worker import CaptionWorkerClient
+        _worker_client = CaptionWorkerClient()
+    return _worker_client
+
+async def _acaption_uncached(image_bytes: bytes) -> str:
+    if CAPTION_MODE == "worker":
+        from app.services.caption_worker import CaptionWorkerUnavailable
+        try:
+            return await _get_worker_client().caption(image_bytes)
+        except CaptionWorkerUnavailable:
+            if not CAPTION_WORKER_FALLBACK:
+                raise
+            _worker_fallbacks.inc()
+    return await _acaption_inprocess(image_bytes)
+
+async def _acaption_cached(image_bytes: bytes, caption_fn: Callable[[bytes], Awaitable[str]]) -> str:
+    cache = get_caption_cache()
+    if cache is None:
+        async with blip_slots.slot():
+            return await caption_fn(image_bytes)
+    # hashing and the optional SQLite tier stay off the event loop (default pool, not the BLIP slots)
+    loop = asyncio.get_running_loop()
+    key = await loop.run_in_executor(None, cache.key_for, image_bytes)
+    caption = await loop.run_in_executor(None, cache.get, key)
+    if caption is None:
+        async with blip_slots.slot():
+            caption = await caption_fn(image_bytes)
+        await loop.run_in_executor(None, cache.put, key, caption)
     return caption
+
+async def acaption_image_bytes(image_bytes: bytes) -> str:
+    with span("caption"):
+        return await _acaption_cached(image_bytes, _acaption_uncached)
+
+async def acaption_local(image_bytes: bytes) -> str:
+    """Caption with the model in this process, whatever CAPTION_MODE says (used by the caption worker)."""
+    return await _acaption_cached(image_bytes, _acaption_inprocess)
+
+async def areadiness() -> Tuple[bool, dict]:
+    if CAPTION_MODE != "worker":
+        return is_ready(), model_status()
+    from app.services.caption_worker import CaptionWorkerUnavailable
+    try:
+        status = await _get_worker_client().status()
+    except CaptionWorkerUnavailable as exc:
+        # with fallback on, this worker can still caption, just slower and with its own model copy
+        return CAPTION_WORKER_FALLBACK and is_ready(), dict(model_status(), mode="worker", worker=str(exc))
+    except Overloaded as exc:
+        # reachable but not answering in time: captions would 503 here, so report not ready
+        return False, dict(model_status(), mode="worker", worker=str(exc))
+    return status.get("state") == "ready", dict(status, mode="worker", worker="ok")
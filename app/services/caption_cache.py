@@ -0,0 +1,211 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, NamedTuple, Optional, Set, Tuple
+
+from PIL import Image
+
+CAPTION_CACHE_ENABLED = os.getenv("CAPTION_CACHE_ENABLED", "1") == "1"
+CAPTION_CACHE_MAX_BYTES = int(os.getenv("CAPTION_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+CAPTION_CACHE_PHASH = os.getenv("CAPTION_CACHE_PHASH", "0") == "1"
+# with 4 bands of 16 bits any hash within distance 3 shares at least one band exactly
+CAPTION_CACHE_PHASH_DISTANCE = int(os.getenv("CAPTION_CACHE_PHASH_DISTANCE", "3"))
+CAPTION_CACHE_DB = os.getenv("CAPTION_CACHE_DB")  # e.g. ".cache/captions.sqlite3"
+
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+_ENTRY_OVERHEAD = 160  # rough per-entry cost of the dict/tuple bookkeeping
+
+class CaptionKey(NamedTuple):
+    sha256: str
+    phash: Optional[int]
+
+def _dhash(image_bytes: bytes) -> Optional[int]:
+    try:
+        img = Image.open(BytesIO(image_bytes))
+        img.draft("L", (64, 64))  # JPEGs decode straight at ~1/8 scale
+        small = img.convert("L").resize((9, 8), Image.BILINEAR)
+    except Exception:
+        return None
+    px = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    # flat, textureless images all hash to ~0 and would match each other
+    if not 8 <= bin(value).count("1") <= 56:
+        return None
+    return value
+
+def _bands(phash: int) -> Tuple[int, ...]:
+    return tuple((phash >> (i * _BAND_BITS)) & _BAND_MASK for i in range(_BANDS))
+
+def _to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _from_signed(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+class CaptionCache:
+    """Content-addressed caption cache.
+
+    Lookups try the exact image hash first and then, if enabled, a perceptual
+    dHash so resized or re-encoded copies of the same photo also hit. Entries
+    live in a byte-budgeted in-memory LRU and optionally in SQLite so they
+    survive restarts.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = CAPTION_CACHE_MAX_BYTES,
+        *,
+        db_path: Optional[str] = None,
+        perceptual: bool = False,
+        max_distance: int = CAPTION_CACHE_PHASH_DISTANCE,
+    ):
+        self.max_bytes = max_bytes
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, Optional[int], int]]" = OrderedDict()
+        self._band_index: Tuple[Dict[int, Set[str]], ...] = tuple({} for _ in range(_BANDS))
+        self._bytes = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = self._open_db(db_path)
+        self.counters = {"hits_exact": 0, "hits_perceptual": 0, "hits_disk": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _open_db(db_path: str) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS captions ("
+            "sha256 TEXT PRIMARY KEY, phash INTEGER, b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER,"
+            "caption TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        for i in range(_BANDS):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_captions_b{i} ON captions(b{i})")
+        return conn
+
+    def key_for(self, image_bytes: bytes) -> CaptionKey:
+        sha = hashlib.sha256(image_bytes).hexdigest()
+        return CaptionKey(sha, _dhash(image_bytes) if self.perceptual else None)
+
+    def get(self, key: CaptionKey) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key.sha256)
+            if entry is not None:
+                self._entries.move_to_end(key.sha256)
+                self.counters["hits_exact"] += 1
+                return entry[0]
+            if key.phash is not None:
+                caption = self._nearest_in_memory(key.phash)
+                if caption is not None:
+                    self.counters["hits_perceptual"] += 1
+                    return caption
+
+        caption = self._get_from_disk(key)
+        with self._lock:
+            if caption is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits_disk"] += 1
+            self._insert(key, caption)
+        return caption
+
+    def put(self, key: CaptionKey, caption: str) -> None:
+        with self._lock:
+            self._insert(key, caption)
+        if self._db is not None:
+            bands = _bands(key.phash) if key.phash is not None else (None,) * _BANDS
+            phash = _to_signed(key.phash) if key.phash is not None else None
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO captions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key.sha256, phash, *bands, caption, time.time()),
+                )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), bytes=self._bytes)
+
+    def _nearest_in_memory(self, phash: int) -> Optional[str]:
+        candidates: Set[str] = set()
+        for band, index in zip(_bands(phash), self._band_index):
+            candidates.update(index.get(band, ()))
+        best: Optional[Tuple[int, str]] = None
+        for sha in candidates:
+            caption, other, _ = self._entries[sha]
+            distance = bin(phash ^ other).count("1")
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, sha)
+        if best is None:
+            return None
+        self._entries.move_to_end(best[1])
+        return self._entries[best[1]][0]
+
+    def _get_from_disk(self, key: CaptionKey) -> Optional[str]:
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT caption FROM captions WHERE sha256 = ?", (key.sha256,)).fetchone()
+            if row is not None or key.phash is None:
+                return row[0] if row else None
+            bands = _bands(key.phash)
+            rows = self._db.execute(
+                "SELECT phash, caption FROM captions WHERE b0 = ? OR b1 = ? OR b2 = ? OR b3 = ?", bands
+            ).fetchall()
+        best = None
+        for other, caption in rows:
+            distance = bin(key.phash ^ _from_signed(other)).count("1")
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, caption)
+        return best[1] if best else None
+
+    def _insert(self, key: CaptionKey, caption: str) -> None:
+        if key.sha256 in self._entries:
+            self._remove(key.sha256)
+        size = len(caption.encode("utf-8")) + len(key.sha256) + _ENTRY_OVERHEAD
+        self._entries[key.sha256] = (caption, key.phash, size)
+        self._bytes += size
+        if key.phash is not None:
+            for band, index in zip(_bands(key.phash), self._band_index):
+                index.setdefault(band, set()).add(key.sha256)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    def _remove(self, sha: str) -> None:
+        _, phash, size = self._entries.pop(sha)
+        self._bytes -= size
+        if phash is not None:
+            for band, index in zip(_bands(phash), self._band_index):
+                members = index.get(band)
+                if members is not None:
+                    members.discard(sha)
+                    if not members:
+                        del index[band]
+
+_cache: Optional[CaptionCache] = None
+_cache_lock = threading.Lock()
+
+def get_caption_cache() -> Optional[CaptionCache]:
+    global _cache
+    if not CAPTION_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CaptionCache(
+                    CAPTION_CACHE_MAX_BYTES,
+                    db_path=CAPTION_CACHE_DB,
+                    perceptual=CAPTION_CACHE_PHASH,
+                )
+    return _cache
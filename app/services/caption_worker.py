@@ -0,0 +1,184 @@
+"""Out-of-process BLIP captioning shared by every API worker on a host.
+
+    python -m app.services.caption_worker --socket /tmp/realestatebot-caption.sock
+    CAPTION_MODE=worker uvicorn app.main:app --workers 4
+
+The worker owns the only copy of the model and micro-batches requests from
+all API workers together. It listens on a Unix socket with length-prefixed
+JSON frames. Small images travel inline; larger ones are written into a
+POSIX shared-memory segment by the client and only its name is sent, so
+the image bytes never go through the socket. The socket is bound before the
+model loads, so early requests queue behind the warmup instead of failing
+over. API workers fall back to in-process captioning only when they cannot
+connect (CAPTION_WORKER_FALLBACK=1); a worker that is up but slow, busy or
+drops the request answers 503 with Retry-After, so the model stays in one
+process.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+
+import orjson
+
+from app.services.admission import Overloaded
+
+CAPTION_WORKER_SOCKET = os.getenv("CAPTION_WORKER_SOCKET", "/tmp/realestatebot-caption.sock")
+CAPTION_WORKER_TIMEOUT_SECONDS = float(os.getenv("CAPTION_WORKER_TIMEOUT_SECONDS", "30"))
+CAPTION_WORKER_SHM_MIN_BYTES = int(os.getenv("CAPTION_WORKER_SHM_MIN_BYTES", str(256 * 1024)))
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct(">I")
+_MAX_FRAME = 1 << 20
+
+class CaptionWorkerUnavailable(ConnectionError):
+    """The worker's socket could not be connected to; the only case that falls back in-process."""
+
+async def _read_frame(reader: asyncio.StreamReader) -> Optional[dict]:
+    try:
+        (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    except asyncio.IncompleteReadError as exc:
+        if exc.partial:
+            raise
+        return None
+    if length > _MAX_FRAME:
+        raise ValueError(f"frame of {length} bytes exceeds {_MAX_FRAME}")
+    return orjson.loads(await reader.readexactly(length))
+
+def _write_frame(writer: asyncio.StreamWriter, message: dict) -> None:
+    body = orjson.dumps(message)
+    writer.write(_LENGTH.pack(len(body)) + body)
+
+class CaptionWorkerClient:
+    """One short-lived Unix socket connection per request; connecting locally costs microseconds."""
+
+    def __init__(self, path: str = CAPTION_WORKER_SOCKET, timeout: float = CAPTION_WORKER_TIMEOUT_SECONDS,
+                 shm_min_bytes: int = CAPTION_WORKER_SHM_MIN_BYTES):
+        self.path = path
+        self.timeout = timeout
+        self.shm_min_bytes = shm_min_bytes
+
+    async def _request(self, header: dict, payload: bytes = b"") -> dict:
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(self.path), 1.0)
+        except (OSError, asyncio.TimeoutError) as exc:
+            raise CaptionWorkerUnavailable(f"caption worker at {self.path} unreachable: {exc}") from exc
+        try:
+            _write_frame(writer, header)
+            if payload:
+                writer.write(payload)
+            await writer.drain()
+            response = await asyncio.wait_for(_read_frame(reader), self.timeout)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            raise Overloaded("caption_worker", "disconnected", 1.0) from None
+        except asyncio.TimeoutError:
+            # the worker is up but its queue is backed up: a 503, not an in-process fallback that
+            # would load another model copy into every API worker
+            raise Overloaded("caption_worker", "timeout", self.timeout) from None
+        finally:
+            writer.close()
+        if response is None:
+            raise Overloaded("caption_worker", "disconnected", 1.0)
+        overloaded = response.get("overloaded")
+        if overloaded:
+            # the worker's BLIP slots are full: a 503 with Retry-After, like an in-process overload
+            raise Overloaded(overloaded["resource"], overloaded["reason"], float(overloaded["retry_after"]))
+        if "error" in response:
+            raise RuntimeError(f"caption worker: {response['error']}")
+        return response
+
+    async def caption(self, image_bytes: bytes) -> str:
+        size = len(image_bytes)
+        if size < self.shm_min_bytes:
+            response = await self._request({"op": "caption", "size": size}, image_bytes)
+            return response["caption"]
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            shm.buf[:size] = image_bytes
+            response = await self._request({"op": "caption", "size": size, "shm": shm.name})
+        finally:
+            shm.close()
+            shm.unlink()
+        return response["caption"]
+
+    async def status(self) -> dict:
+        return (await self._request({"op": "status"}))["status"]
+
+def _read_shared(name: str, size: int) -> bytes:
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        # the client owns the segment; stop this process's tracker from unlinking it at exit
+        # (the tracker knows POSIX segments by their leading-slash name)
+        resource_tracker.unregister("/" + shm.name, "shared_memory")
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    from app.services import blip_captioner
+
+    try:
+        while True:
+            header = await _read_frame(reader)
+            if header is None:
+                break
+            op = header.get("op")
+            try:
+                if op == "status":
+                    response = {"status": blip_captioner.model_status()}
+                elif op == "caption":
+                    size = int(header["size"])
+                    if header.get("shm"):
+                        image_bytes = _read_shared(header["shm"], size)
+                    else:
+                        image_bytes = await reader.readexactly(size)
+                    response = {"caption": await blip_captioner.acaption_local(image_bytes)}
+                else:
+                    response = {"error": f"unknown op {op!r}"}
+            except (asyncio.IncompleteReadError, ConnectionError):
+                raise
+            except Overloaded as exc:
+                response = {"error": str(exc), "overloaded": {
+                    "resource": exc.resource, "reason": exc.reason, "retry_after": exc.retry_after}}
+            except Exception as exc:
+                response = {"error": f"{exc.__class__.__name__}: {exc}"}
+            _write_frame(writer, response)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(path: str = CAPTION_WORKER_SOCKET) -> None:
+    from app.services import blip_captioner
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(_handle, path=path)
+    os.chmod(path, 0o660)
+    logger.info("caption worker listening on %s (backend %s)", path, blip_captioner.BLIP_BACKEND)
+    # bound before the model loads: requests wait for the warmup rather than fall back in-process
+    asyncio.ensure_future(blip_captioner.awarm_up())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve BLIP captions to local API workers.")
+    parser.add_argument("--socket", default=CAPTION_WORKER_SOCKET)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        asyncio.run(serve(args.socket))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
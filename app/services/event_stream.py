@@ -0,0 +1,52 @@
+import asyncio
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+Event = Tuple[str, Dict[str, Any]]
+
+# set per /chat/stream request; copied into graph tasks and executor threads with the context
+_sink: ContextVar[Optional[Tuple[asyncio.AbstractEventLoop, "asyncio.Queue[Event]"]]] = ContextVar(
+    "event_sink", default=None
+)
+
+def is_streaming() -> bool:
+    return _sink.get() is not None
+
+def emit(event: str, data: Dict[str, Any]) -> None:
+    """Push an event to the current request's stream; a no-op outside /chat/stream."""
+    sink = _sink.get()
+    if sink is None:
+        return
+    loop, queue = sink
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        queue.put_nowait((event, data))
+    else:
+        # sync nodes run in worker threads
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+@contextmanager
+def open_event_stream() -> Iterator["asyncio.Queue[Event]"]:
+    queue: "asyncio.Queue[Event]" = asyncio.Queue()
+    token = _sink.set((asyncio.get_running_loop(), queue))
+    try:
+        yield queue
+    finally:
+        _sink.reset(token)
+
+@contextmanager
+def muted() -> Iterator[None]:
+    """Suppress events for work started inside, e.g. speculative calls that may be discarded."""
+    token = _sink.set(None)
+    try:
+        yield
+    finally:
+        _sink.reset(token)
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
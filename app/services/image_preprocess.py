@@ -0,0 +1,127 @@
+import os
+import time
+from io import BytesIO
+from typing import Optional
+
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+from PIL import Image
+
+from app.services.metrics import counter, histogram
+
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+# BLIP looks at 384x384; keep a little headroom for the perceptual cache hash and future models
+IMAGE_TARGET_SIZE = int(os.getenv("IMAGE_TARGET_SIZE", "512"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "90"))
+
+_CHUNK = 64 * 1024
+# multipart boundaries, headers and the text fields that travel next to the image
+_FORM_OVERHEAD = 64 * 1024
+_ORIENTATION_TAG = 0x0112
+# same mapping as ImageOps.exif_transpose
+_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+_rejected = counter("image_rejected_total", "Uploads refused before captioning", ["reason"])
+_preprocess_seconds = histogram("image_preprocess_seconds", "Decode, orient and downscale time per upload")
+
+class ImageRejected(Exception):
+    def __init__(self, status_code: int, reason: str, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.detail = detail
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Pillow format name from the file signature, or None if it is not an image we accept."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if head.startswith(b"BM"):
+        return "BMP"
+    return None
+
+def _reject(status_code: int, reason: str, detail: str) -> ImageRejected:
+    _rejected.inc(reason=reason)
+    return ImageRejected(status_code, reason, detail)
+
+async def read_upload(upload: UploadFile, max_bytes: int = IMAGE_MAX_UPLOAD_BYTES) -> Optional[bytes]:
+    """Read an upload in chunks, giving up as soon as it passes ``max_bytes``
+    or its first bytes are not a supported image."""
+    buf = bytearray()
+    while True:
+        chunk = await upload.read(_CHUNK)
+        if not chunk:
+            break
+        if not buf and sniff_format(chunk[:16]) is None:
+            raise _reject(415, "unsupported_format", "upload is not a JPEG, PNG, WebP, GIF or BMP image")
+        buf += chunk
+        if len(buf) > max_bytes:
+            raise _reject(413, "too_large", f"image larger than {max_bytes} bytes")
+    return bytes(buf) or None
+
+class UploadLimitMiddleware:
+    """Refuses a request whose declared Content-Length is over the upload cap with 413,
+    before Starlette parses and spools the multipart body. Bodies without a length
+    (chunked) are still stopped by read_upload's streaming cap."""
+
+    def __init__(self, app, max_body_bytes: int = IMAGE_MAX_UPLOAD_BYTES + _FORM_OVERHEAD):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            length = dict(scope.get("headers") or ()).get(b"content-length")
+            if length is not None and length.isdigit() and int(length) > self.max_body_bytes:
+                _rejected.inc(reason="too_large")
+                response = JSONResponse({"detail": f"request body larger than {self.max_body_bytes} bytes"},
+                                        status_code=413, headers={"Connection": "close"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+def preprocess_image(data: bytes, target: int = IMAGE_TARGET_SIZE) -> bytes:
+    """Decode at (roughly) the target scale, apply EXIF orientation, and
+    re-encode as an RGB JPEG no larger than ``target`` on its long side."""
+    started = time.perf_counter()
+    fmt = sniff_format(data[:16])
+    if fmt is None:
+        raise _reject(415, "unsupported_format", "upload is not a JPEG, PNG, WebP, GIF or BMP image")
+    try:
+        img = Image.open(BytesIO(data))
+        if img.format != fmt:
+            raise _reject(415, "format_mismatch", f"file signature says {fmt}, decoder says {img.format}")
+        # read the orientation before scaling; rotating the small image is much cheaper
+        orientation = img.getexif().get(_ORIENTATION_TAG, 1)
+        if fmt == "JPEG":
+            # libjpeg scales by 1/2, 1/4 or 1/8 while decoding, never below the requested size
+            img.draft("RGB", (target, target))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        factor = min(img.size) // target
+        if factor >= 2:
+            img = img.reduce(factor)
+        img.thumbnail((target, target), Image.BICUBIC)
+        if orientation in _TRANSPOSE:
+            img = img.transpose(_TRANSPOSE[orientation])
+    except Image.DecompressionBombError:
+        raise _reject(413, "too_many_pixels", "image has too many pixels")
+    except (OSError, SyntaxError, ValueError):
+        raise _reject(422, "undecodable", "image could not be decoded")
+
+    out = BytesIO()
+    img.save(out, "JPEG", quality=IMAGE_JPEG_QUALITY)
+    _preprocess_seconds.observe(time.perf_counter() - started)
+    return out.getvalue()
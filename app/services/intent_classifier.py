@@ -0,0 +1,105 @@
+import os
+import re
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+INTENT_MODEL_PATH = Path(os.getenv("INTENT_MODEL_PATH") or Path(__file__).resolve().parents[1]/"models"/"intent_classifier.npz")
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.8"))
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+def featurize(text: str, n_bits: int) -> np.ndarray:
+    """Hashed word unigrams, word bigrams and in-word character trigrams.
+
+    crc32 rather than hash() so indices are stable across processes.
+    """
+    mask = (1 << n_bits) - 1
+    words = _WORD_RE.findall((text or "").lower())
+    grams: List[str] = [f"w:{w}" for w in words]
+    grams.extend(f"b:{a} {b}" for a, b in zip(words, words[1:]))
+    for w in words:
+        padded = f"<{w}>"
+        grams.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    if not grams:
+        return np.zeros(0, dtype=np.int64)
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) & mask for g in grams), dtype=np.int64, count=len(grams))
+
+class Prediction(NamedTuple):
+    agent: str
+    confidence: float
+    scores: Dict[str, float]
+
+class IntentClassifier:
+    """Multinomial logistic regression over hashed n-gram features.
+
+    Inference is a gather-and-sum over the weight rows of the hashed
+    features plus a softmax, so it runs in microseconds on CPU.
+    """
+
+    def __init__(self, classes: Sequence[str], n_bits: int = 16,
+                 weights: Optional[np.ndarray] = None, bias: Optional[np.ndarray] = None):
+        self.classes = list(classes)
+        self.n_bits = n_bits
+        self.weights = weights if weights is not None else np.zeros((1 << n_bits, len(self.classes)), dtype=np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(self.classes), dtype=np.float32)
+
+    def _probs(self, features: np.ndarray) -> np.ndarray:
+        logits = self.bias + (self.weights[features].sum(axis=0) if features.size else 0.0)
+        logits = logits - logits.max()
+        exp = np.exp(logits)
+        return exp / exp.sum()
+
+    def predict(self, text: str) -> Prediction:
+        probs = self._probs(featurize(text, self.n_bits))
+        best = int(np.argmax(probs))
+        return Prediction(self.classes[best], float(probs[best]), {c: float(p) for c, p in zip(self.classes, probs)})
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str], *, epochs: int = 20,
+            lr: float = 0.5, l2: float = 1e-5, seed: int = 0) -> "IntentClassifier":
+        rng = np.random.default_rng(seed)
+        features = [featurize(t, self.n_bits) for t in texts]
+        targets = np.array([self.classes.index(label) for label in labels])
+        for epoch in range(epochs):
+            step = lr / (1.0 + epoch)
+            for i in rng.permutation(len(features)):
+                feats = features[i]
+                grad = self._probs(feats)
+                grad[targets[i]] -= 1.0
+                if feats.size:
+                    # a feature hashed twice into one row gets the gradient twice, as in the forward pass
+                    np.subtract.at(self.weights, feats, (step * grad).astype(np.float32))
+                    if l2:
+                        self.weights[feats] *= (1.0 - step * l2)
+                self.bias -= (step * grad).astype(np.float32)
+        return self
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, weights=self.weights, bias=self.bias,
+                            classes=np.array(self.classes), n_bits=np.array(self.n_bits))
+
+    @classmethod
+    def load(cls, path: Path) -> "IntentClassifier":
+        with np.load(path) as data:
+            return cls([str(c) for c in data["classes"]], int(data["n_bits"]),
+                       weights=data["weights"].astype(np.float32), bias=data["bias"].astype(np.float32))
+
+_classifier: Optional[IntentClassifier] = None
+_loaded = False
+_load_lock = threading.Lock()
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """The trained model at INTENT_MODEL_PATH, or None if nothing has been trained yet."""
+    global _classifier, _loaded
+    if not _loaded:
+        with _load_lock:
+            if not _loaded:
+                if INTENT_MODEL_PATH.exists():
+                    _classifier = IntentClassifier.load(INTENT_MODEL_PATH)
+                _loaded = True
+    return _classifier
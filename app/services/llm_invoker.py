@@ -1,24 +1,355 @@
+import asyncio
 import os
-from typing import Optional
-from openai import OpenAI
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+import httpx
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
 
+from app.services.admission import llm_slots
+from app.services.event_stream import emit, is_streaming
+from app.services.llm_resilience import (
+    CircuitBreaker,
+    LatencyTracker,
+    LLMDeadlineExceeded,
+    backoff_delay,
+    is_retryable,
+    retry_after_seconds,
+)
+from app.services.metrics import counter, gauge
+from app.services.token_accounting import count_tokens, record_usage
+from app.services.tracing import span
+
 load_dotenv(".env")
 
+# OPENAI_BASE_URL is read by the openai client itself, e.g. http://127.0.0.1:8001/v1 for benchmarks/mock_openai_server.py
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_MS = float(os.getenv("LLM_RETRY_BASE_MS", "250"))
+LLM_RETRY_MAX_MS = float(os.getenv("LLM_RETRY_MAX_MS", "4000"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# send a duplicate request when the first is slower than this percentile of recent calls
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# identical prompts already in flight share one upstream call (streamed calls never do)
+LLM_COALESCE = os.getenv("LLM_COALESCE", "1") == "1"
+LLM_TEMPERATURE = 0.3
+
 _client: Optional[OpenAI] = None
+_async_client: Optional[AsyncOpenAI] = None
+_breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+_latency = LatencyTracker()
+_counters = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "deadline_exceeded": 0, "coalesced": 0}
+
+FlightKey = Tuple[str, Optional[str], str, float, bool]
+
+class _Flight:
+    """One upstream call shared by every async caller with the same key."""
+
+    def __init__(self, task: "asyncio.Future[str]"):
+        self.task = task
+        self.waiters = 0
+
+class _SyncFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+_flights: Dict[FlightKey, _Flight] = {}
+_sync_flights: Dict[FlightKey, _SyncFlight] = {}
+_sync_flights_lock = threading.Lock()
+_coalesced = counter("llm_coalesced_calls_total", "LLM calls answered by an identical call already in flight", ["agent"])
+gauge("llm_inflight_prompts", "Distinct prompts with an upstream LLM call in flight").set_function(
+    lambda: len(_flights) + len(_sync_flights)
+)
+
+T = TypeVar("T")
+
+def _http_options() -> dict:
+    # the deadline is enforced per call; the pool timeout only bounds waiting for a free connection
+    return {
+        "limits": httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE),
+        "timeout": httpx.Timeout(LLM_DEADLINE_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+    }
 
 def _get_client() -> OpenAI:
     global _client
     if _client is None:
-        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0,
+                         http_client=httpx.Client(**_http_options()))
     return _client
 
-def call_openai_prompt(prompt_text: str, *, model: str = "gpt-4o-mini", system: Optional[str] = None) -> str:
-    client = _get_client()
+def _get_async_client() -> AsyncOpenAI:
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0,
+                                    http_client=httpx.AsyncClient(**_http_options()))
+    return _async_client
+
+def llm_retry_after() -> float:
+    return _breaker.retry_after()
+
+def llm_stats() -> dict:
+    p95 = _latency.percentile(95)
+    return dict(_counters, breaker=_breaker.state, p95_seconds=p95)
+
+def _build_messages(prompt_text: str, system: Optional[str]) -> list:
     messages = []
     if system:
         messages.append({"role": "system", "content": system})
     messages.append({"role": "user", "content": prompt_text})
+    return messages
+
+def _backoff(attempt: int, exc: BaseException) -> float:
+    return backoff_delay(attempt, LLM_RETRY_BASE_MS / 1000.0, LLM_RETRY_MAX_MS / 1000.0, retry_after_seconds(exc))
+
+def _deadline_exceeded(deadline: float) -> LLMDeadlineExceeded:
+    _counters["deadline_exceeded"] += 1
+    return LLMDeadlineExceeded(f"LLM call exceeded its {deadline:.1f}s deadline")
+
+def _with_retries(request: Callable[[float], T], deadline: float) -> T:
+    _counters["calls"] += 1
+    expires = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            raise _deadline_exceeded(deadline)
+        probe = _breaker.before_call()
+        started = time.monotonic()
+        try:
+            result = request(remaining)
+        except Exception as exc:
+            if not is_retryable(exc):
+                _breaker.record_success()  # a 4xx is our fault, not a sign the upstream is down
+                raise
+            _breaker.record_failure()
+            delay = _backoff(attempt, exc)
+            if attempt >= LLM_MAX_RETRIES or time.monotonic() + delay >= expires:
+                if time.monotonic() >= expires:
+                    raise _deadline_exceeded(deadline) from exc
+                raise
+            attempt += 1
+            _counters["retries"] += 1
+            time.sleep(delay)
+            continue
+        except BaseException:
+            if probe:
+                _breaker.release_probe()
+            raise
+        _breaker.record_success()
+        _latency.record(time.monotonic() - started)
+        return result
+
+async def _hedged(request: Callable[[float], Awaitable[T]], timeout: float) -> T:
+    hedge_after = _latency.percentile(LLM_HEDGE_PERCENTILE) if LLM_HEDGE else None
+    if hedge_after is None or hedge_after >= timeout:
+        return await asyncio.wait_for(request(timeout), timeout)
+
+    started = time.monotonic()
+    primary = asyncio.ensure_future(request(timeout))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    _counters["hedges"] += 1
+    backup = asyncio.ensure_future(request(timeout - hedge_after))
+    pending = {primary, backup}
+    try:
+        while pending:
+            remaining = timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    _counters["hedge_wins"] += task is backup
+                    return task.result()
+                if not pending:
+                    raise task.exception()
+        raise asyncio.TimeoutError()
+    finally:
+        for task in (primary, backup):
+            if not task.done():
+                task.cancel()
+
+async def _awith_retries(request: Callable[[float], Awaitable[T]], deadline: float,
+                         *, hedge: bool = True, retryable: Callable[[], bool] = lambda: True) -> T:
+    _counters["calls"] += 1
+    expires = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            raise _deadline_exceeded(deadline)
+        probe = _breaker.before_call()
+        started = time.monotonic()
+        try:
+            if hedge:
+                result = await _hedged(request, remaining)
+            else:
+                result = await asyncio.wait_for(request(remaining), remaining)
+        except asyncio.TimeoutError as exc:
+            _breaker.record_failure()
+            raise _deadline_exceeded(deadline) from exc
+        except Exception as exc:
+            if not is_retryable(exc):
+                _breaker.record_success()
+                raise
+            _breaker.record_failure()
+            delay = _backoff(attempt, exc)
+            if attempt >= LLM_MAX_RETRIES or not retryable() or time.monotonic() + delay >= expires:
+                if time.monotonic() >= expires:
+                    raise _deadline_exceeded(deadline) from exc
+                raise
+            attempt += 1
+            _counters["retries"] += 1
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # cancelled mid-call (client gone, speculation dropped): no outcome, but free the probe slot
+            if probe:
+                _breaker.release_probe()
+            raise
+        _breaker.record_success()
+        _latency.record(time.monotonic() - started)
+        return result
+
+def _record_usage(agent: Optional[str], model: str, messages: list, completion: str, usage=None) -> None:
+    # the API's own count when it sends one; streamed responses carry none in this client version
+    if usage is not None and usage.total_tokens:
+        record_usage(agent, usage.prompt_tokens, usage.completion_tokens)
+        return
+    # chat formatting adds a few tokens per message on top of the content
+    prompt_tokens = sum(count_tokens(m["content"], model) + 4 for m in messages) + 3
+    record_usage(agent, prompt_tokens, count_tokens(completion, model))
+
+def _request_options(json_mode: bool) -> dict:
+    return {"response_format": {"type": "json_object"}} if json_mode else {}
+
+def _flight_key(model: str, system: Optional[str], prompt_text: str, json_mode: bool) -> FlightKey:
+    return (model, system, prompt_text, LLM_TEMPERATURE, json_mode)
+
+def _complete(prompt_text: str, model: str, system: Optional[str], deadline: Optional[float],
+              agent: Optional[str], json_mode: bool) -> str:
+    client = _get_client()
+    messages = _build_messages(prompt_text, system)
+    options = _request_options(json_mode)
+    resp = _with_retries(
+        lambda timeout: client.chat.completions.create(model=model, messages=messages, temperature=LLM_TEMPERATURE,
+                                                       timeout=timeout, **options),
+        deadline or LLM_DEADLINE_SECONDS,
+    )
+    completion = resp.choices[0].message.content.strip()
+    _record_usage(agent, model, messages, completion, resp.usage)
+    return completion
+
+def call_openai_prompt(prompt_text: str, *, model: str = "gpt-4o-mini", system: Optional[str] = None,
+                       deadline: Optional[float] = None, agent: Optional[str] = None, json_mode: bool = False) -> str:
+    with span("llm", agent, model=model):
+        if not LLM_COALESCE:
+            return _complete(prompt_text, model, system, deadline, agent, json_mode)
+        key = _flight_key(model, system, prompt_text, json_mode)
+        with _sync_flights_lock:
+            flight = _sync_flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _sync_flights[key] = _SyncFlight()
+        if not leader:
+            _counters["coalesced"] += 1
+            _coalesced.inc(agent=agent or "unknown")
+            if not flight.done.wait(deadline or LLM_DEADLINE_SECONDS):
+                raise _deadline_exceeded(deadline or LLM_DEADLINE_SECONDS)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = _complete(prompt_text, model, system, deadline, agent, json_mode)
+            return flight.result
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with _sync_flights_lock:
+                _sync_flights.pop(key, None)
+            flight.done.set()
+
+async def _acomplete(prompt_text: str, model: str, system: Optional[str], deadline: Optional[float],
+                     agent: Optional[str], json_mode: bool) -> str:
+    client = _get_async_client()
+    messages = _build_messages(prompt_text, system)
+    options = _request_options(json_mode)
+    async with llm_slots.slot():
+        resp = await _awith_retries(
+            lambda timeout: client.chat.completions.create(model=model, messages=messages,
+                                                           temperature=LLM_TEMPERATURE, timeout=timeout, **options),
+            deadline or LLM_DEADLINE_SECONDS,
+        )
+    completion = resp.choices[0].message.content.strip()
+    _record_usage(agent, model, messages, completion, resp.usage)
+    return completion
+
+async def _single_flight(key: FlightKey, agent: Optional[str], call: Callable[[], Awaitable[str]]) -> str:
+    flight = _flights.get(key)
+    if flight is None:
+        # a task of its own, so the call outlives a cancelled leader while others still wait on it
+        flight = _flights[key] = _Flight(asyncio.ensure_future(call()))
+        flight.task.add_done_callback(lambda _: _flights.pop(key, None) if _flights.get(key) is flight else None)
+    else:
+        _counters["coalesced"] += 1
+        _coalesced.inc(agent=agent or "unknown")
+    flight.waiters += 1
+    try:
+        return await asyncio.shield(flight.task)
+    finally:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            # every caller gave up; later callers must not join a call that is being cancelled
+            if _flights.get(key) is flight:
+                del _flights[key]
+            flight.task.cancel()
+
+async def acall_openai_prompt(prompt_text: str, *, model: str = "gpt-4o-mini", system: Optional[str] = None,
+                              deadline: Optional[float] = None, agent: Optional[str] = None,
+                              json_mode: bool = False) -> str:
+    if is_streaming():
+        client = _get_async_client()
+        messages = _build_messages(prompt_text, system)
+        options = _request_options(json_mode)
+        parts: list = []
+        # once tokens have reached the client a retry would repeat them, so only retry before the first one
+        with span("llm", agent, model=model, stream=True):
+            async with llm_slots.slot():
+                completion = await _awith_retries(
+                    lambda timeout: _astream_completion(client, model, messages, timeout, parts, options),
+                    deadline or LLM_DEADLINE_SECONDS, hedge=False, retryable=lambda: not parts,
+                )
+        _record_usage(agent, model, messages, completion)
+        return completion
+    with span("llm", agent, model=model):
+        if not LLM_COALESCE:
+            return await _acomplete(prompt_text, model, system, deadline, agent, json_mode)
+        return await _single_flight(
+            _flight_key(model, system, prompt_text, json_mode), agent,
+            lambda: _acomplete(prompt_text, model, system, deadline, agent, json_mode),
+        )
 
-    resp = client.chat.completions.create(model=model, messages=messages, temperature=0.3)
-    return resp.choices[0].message.content.strip()
\ No newline at end of file
+async def _astream_completion(client: AsyncOpenAI, model: str, messages: list, timeout: float, parts: list,
+                              options: dict) -> str:
+    # forward tokens to the /chat/stream client as they arrive, return the full text as usual
+    stream = await client.chat.completions.create(model=model, messages=messages, temperature=LLM_TEMPERATURE,
+                                                  stream=True, timeout=timeout, **options)
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            emit("token", {"text": delta})
+    return "".join(parts).strip()
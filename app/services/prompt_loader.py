@@ -1,6 +1,25 @@
+import hashlib
+import os
+import re
+import threading
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader, select_autoescape, Template
-from typing import Dict, Any
+from jinja2 import Environment, FileSystemLoader, select_autoescape, Template, TemplateNotFound
+from typing import Dict, Any, NamedTuple, Optional, Tuple
+
+from app.services.metrics import counter
+from app.services.token_accounting import truncate_to_tokens
+from app.services.tracing import span
+
+PROMPTS_DIR = Path(__file__).resolve().parents[1]/"prompts"
+# recompile templates when files under app/prompts change (watchdog if installed, else mtime polling)
+PROMPT_HOT_RELOAD = os.getenv("PROMPT_HOT_RELOAD", "1") == "1"
+PROMPT_RELOAD_POLL_SECONDS = float(os.getenv("PROMPT_RELOAD_POLL_SECONDS", "2"))
+# strip per-line indentation and blank-line runs from rendered prompts
+PROMPT_COMPACT = os.getenv("PROMPT_COMPACT", "1") == "1"
+# longest user_text / question / caption / history passed into a template, in tokens (0 = unbounded)
+PROMPT_INPUT_TOKEN_BUDGET = int(os.getenv("PROMPT_INPUT_TOKEN_BUDGET", "512"))
+
+_BLANK_RUNS = re.compile(r"\n{3,}")
 
 DEFAULT_TEMPLATES: Dict[str, str] = {
     "agent_1_diagnosis.j2": (
@@ -14,6 +33,9 @@ DEFAULT_TEMPLATES: Dict[str, str] = {
         {% endset %}
         SYSTEM: {{ guidance | trim }}
 
+        {% if history %}CONVERSATION_SO_FAR:
+        {{ history }}
+        {% endif %}
         IMAGE_DESCRIPTION: {{ caption }}
         USER_MESSAGE: {{ user_text or "No additional message." }}
 
@@ -29,6 +51,9 @@ DEFAULT_TEMPLATES: Dict[str, str] = {
         {% endset %}
         SYSTEM: {{ guidance | trim }}
 
+        {% if history %}CONVERSATION_SO_FAR:
+        {{ history }}
+        {% endif %}
         QUERY: {{ question }}
         LOCATION: {{ location or "unknown" }}
 
@@ -39,34 +64,162 @@ DEFAULT_TEMPLATES: Dict[str, str] = {
         """
         The user query was unclear. Ask a single clarifying question to route properly.
         Consider whether it's (A) image-based property issue, or (B) tenancy FAQ.
+        {% if history %}CONVERSATION_SO_FAR:
+        {{ history }}
+        {% endif %}
         USER_TEXT: {{ user_text or "" }}
-        Return JSON with keys: clarifying_question, suggested_agent ("agent_1"|"agent_2").
+        Return JSON with keys: clarifying_question, suggested_agent ("agent_1"|"agent_2"),
+        confidence (0-1, how sure you are that suggested_agent can answer the message as written).
         """
     ),
 }
 
-_env = None
+_reloads = counter("prompt_template_reloads_total", "Prompt template registry rebuilds", ["result"])
+
+def _version(source: str) -> str:
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+
+class CompiledTemplate(NamedTuple):
+    template: Template
+    version: str
+    origin: str  # "file" or "default"
+
+class TemplateRegistry:
+    """Every prompt template compiled once and looked up by name.
 
-def _get_env() -> Environment:
-    global _env
-    if _env is None:
-        prompts_dir = Path(__file__).resolve().parents[1]/"prompts"
-        prompts_dir.mkdir(parents=True, exist_ok=True)
-        _env = Environment(
-            loader=FileSystemLoader(prompts_dir),
+    Files in ``prompts_dir`` override the built-in DEFAULT_TEMPLATES of the
+    same name. ``reload()`` rebuilds the table only when a file's mtime or
+    size changed, and swaps it in whole, so renders never lock. A file that
+    fails to compile keeps serving its previous version.
+    """
+
+    def __init__(self, prompts_dir: Path, defaults: Dict[str, str]):
+        self.prompts_dir = prompts_dir
+        self.prompts_dir.mkdir(parents=True, exist_ok=True)
+        self.generation = 0
+        self.errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[Dict[str, Tuple[int, int]]] = None
+        self._watcher = None
+        default_env = Environment()
+        self._defaults = {
+            name: CompiledTemplate(default_env.from_string(raw), _version(raw), "default")
+            for name, raw in defaults.items()
+        }
+        self._entries: Dict[str, CompiledTemplate] = dict(self._defaults)
+        self.reload()
+
+    def _file_env(self) -> Environment:
+        return Environment(
+            loader=FileSystemLoader(self.prompts_dir),
             autoescape=select_autoescape(enabled_extensions=('j2',), default_for_string=False),
             trim_blocks=True,
-            lstrip_blocks=True
+            lstrip_blocks=True,
+            auto_reload=False,
         )
-    return _env
+
+    def _scan(self, env: Environment) -> Dict[str, Tuple[int, int]]:
+        fingerprint = {}
+        for name in env.list_templates():
+            try:
+                st = (self.prompts_dir / name).stat()
+            except OSError:
+                continue
+            fingerprint[name] = (st.st_mtime_ns, st.st_size)
+        return fingerprint
+
+    def reload(self) -> bool:
+        with self._lock:
+            env = self._file_env()
+            fingerprint = self._scan(env)
+            if fingerprint == self._fingerprint:
+                return False
+            entries = dict(self._defaults)
+            errors = {}
+            for name in fingerprint:
+                try:
+                    source, _, _ = env.loader.get_source(env, name)
+                    entries[name] = CompiledTemplate(env.get_template(name), _version(source), "file")
+                except Exception as exc:
+                    errors[name] = f"{exc.__class__.__name__}: {exc}"
+                    previous = self._entries.get(name)
+                    if previous is not None:
+                        entries[name] = previous
+            self._entries = entries
+            self._fingerprint = fingerprint
+            self.errors = errors
+            self.generation += 1
+        _reloads.inc(result="error" if errors else "ok")
+        return True
+
+    def get(self, name: str) -> CompiledTemplate:
+        entry = self._entries.get(name)
+        if entry is None:
+            raise TemplateNotFound(name)
+        return entry
+
+    def versions(self) -> Dict[str, str]:
+        return {name: entry.version for name, entry in self._entries.items()}
+
+    def start_watching(self, poll_seconds: float = PROMPT_RELOAD_POLL_SECONDS) -> None:
+        if self._watcher is not None:
+            return
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            self._watcher = threading.Thread(target=self._poll, args=(poll_seconds,), name="prompt-reload", daemon=True)
+            self._watcher.start()
+            return
+
+        registry = self
+
+        class _OnChange(FileSystemEventHandler):
+            def on_any_event(self, event):
+                registry.reload()
+
+        observer = Observer()
+        observer.daemon = True
+        observer.schedule(_OnChange(), str(self.prompts_dir), recursive=True)
+        observer.start()
+        self._watcher = observer
+
+    def _poll(self, poll_seconds: float) -> None:
+        stop = threading.Event()
+        while not stop.wait(poll_seconds):
+            self.reload()
+
+_registry: Optional[TemplateRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_registry() -> TemplateRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = TemplateRegistry(PROMPTS_DIR, DEFAULT_TEMPLATES)
+                if PROMPT_HOT_RELOAD:
+                    registry.start_watching()
+                _registry = registry
+    return _registry
+
+def compact_prompt(text: str) -> str:
+    lines = (line.strip() for line in text.splitlines())
+    return _BLANK_RUNS.sub("\n\n", "\n".join(lines)).strip()
+
+def _bound_inputs(context: Dict[str, Any]) -> Dict[str, Any]:
+    if PROMPT_INPUT_TOKEN_BUDGET <= 0:
+        return context
+    return {
+        key: truncate_to_tokens(value, PROMPT_INPUT_TOKEN_BUDGET) if isinstance(value, str) else value
+        for key, value in context.items()
+    }
 
 def render_prompt(template_name: str, context: Dict[str, Any]) -> str:
-    env = _get_env()
-    try:
-        template: Template = env.get_template(template_name)
-        return template.render(**context)
-    except Exception:
-        raw = DEFAULT_TEMPLATES.get(template_name)
-        if not raw:
-            raise
-        return Environment().from_string(raw).render(**context)
\ No newline at end of file
+    with span("render_prompt", template=template_name):
+        rendered = get_registry().get(template_name).template.render(**_bound_inputs(context))
+        return compact_prompt(rendered) if PROMPT_COMPACT else rendered
+
+def template_version(template_name: str) -> str:
+    """Short content hash of the template source currently in use, for cache keys."""
+    return get_registry().get(template_name).version
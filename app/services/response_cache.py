@@ -0,0 +1,143 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(24 * 3600)))
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "0") == "1"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.92"))
+RESPONSE_CACHE_EMBED_MODEL = os.getenv("RESPONSE_CACHE_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+_PUNCT = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+def normalize_text(text: Optional[str]) -> str:
+    return _SPACES.sub(" ", _PUNCT.sub(" ", (text or "").lower())).strip()
+
+class _Entry(NamedTuple):
+    response: str
+    expires_at: float
+    embedding: Optional[np.ndarray]
+
+class _Embedder:
+    """Mean-pooled sentence embeddings from a small local encoder, on CPU."""
+
+    def __init__(self, model_name: str):
+        from transformers import AutoModel, AutoTokenizer
+        import torch
+
+        self._torch = torch
+        self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self._model = AutoModel.from_pretrained(model_name).eval()
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> np.ndarray:
+        with self._lock, self._torch.no_grad():
+            enc = self._tokenizer([text], padding=True, truncation=True, max_length=128, return_tensors="pt")
+            hidden = self._model(**enc).last_hidden_state
+            mask = enc["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        vec = pooled[0].numpy().astype(np.float32)
+        return vec / max(float(np.linalg.norm(vec)), 1e-9)
+
+class ResponseCache:
+    """Answer cache keyed on normalized (question, location, template version).
+
+    The exact tier is an LRU with a per-entry TTL. When an embedder is
+    configured, a miss falls back to the most similar cached question within
+    the same location/template partition, if its cosine similarity clears the
+    threshold.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        *,
+        embedder: Optional[_Embedder] = None,
+        similarity_threshold: float = RESPONSE_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._embedder = embedder
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str, str], _Entry]" = OrderedDict()
+        self.counters = {"hits_exact": 0, "hits_semantic": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def make_key(question: str, location: Optional[str], template_version: str) -> Tuple[str, str, str]:
+        return (normalize_text(question), normalize_text(location), template_version)
+
+    def get(self, question: str, location: Optional[str], template_version: str) -> Optional[str]:
+        key = self.make_key(question, location, template_version)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.counters["hits_exact"] += 1
+                    return entry.response
+                del self._entries[key]
+                self.counters["expired"] += 1
+            if self._embedder is None:
+                self.counters["misses"] += 1
+                return None
+
+        query = self._embedder.embed(key[0])
+        with self._lock:
+            match = self._most_similar(query, key[1], key[2], now)
+            if match is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(match)
+            self.counters["hits_semantic"] += 1
+            return self._entries[match].response
+
+    def put(self, question: str, location: Optional[str], template_version: str, response: str) -> None:
+        key = self.make_key(question, location, template_version)
+        embedding = self._embedder.embed(key[0]) if self._embedder is not None else None
+        with self._lock:
+            self._entries[key] = _Entry(response, time.time() + self.ttl_seconds, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries))
+
+    def _most_similar(self, query: np.ndarray, location: str, version: str, now: float) -> Optional[Tuple[str, str, str]]:
+        keys: List[Tuple[str, str, str]] = []
+        vectors: List[np.ndarray] = []
+        for key, entry in self._entries.items():
+            if key[1] == location and key[2] == version and entry.embedding is not None and entry.expires_at > now:
+                keys.append(key)
+                vectors.append(entry.embedding)
+        if not keys:
+            return None
+        scores = np.stack(vectors) @ query
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity_threshold else None
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                embedder = _Embedder(RESPONSE_CACHE_EMBED_MODEL) if RESPONSE_CACHE_SEMANTIC else None
+                _cache = ResponseCache(embedder=embedder)
+    return _cache
@@ -0,0 +1,91 @@
+"""Parse each agent completion exactly once, into that agent's schema.
+
+The model is asked for a JSON object (JSON mode, LLM_JSON_MODE=1). Replies
+that still arrive wrapped in ```json fences or with prose around the
+object are tolerated. The validated model goes into the graph state as
+``data``; ``response`` keeps the pretty-printed JSON for older clients.
+"""
+import json
+import os
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Type, Union
+
+from pydantic import BaseModel, ValidationError, validator
+
+from app.services.metrics import counter
+
+# response_format={"type": "json_object"}; every agent prompt already asks for JSON, which the API requires
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "1") == "1"
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+
+_parsed = counter("llm_structured_output_total", "Agent completions by parse outcome", ["agent", "result"])
+
+class _Schema(BaseModel):
+    class Config:
+        extra = "allow"  # keys the agents don't read still reach the client
+
+class DiagnosisResponse(_Schema):
+    issue: Optional[str] = None
+    reasoning: Optional[str] = None
+    # a list of steps, or {"steps": [...], "who_to_contact": [...]}
+    recommendations: Union[Dict[str, Any], List[Any], str, None] = None
+    follow_up_question: Optional[str] = None
+
+class TenancyResponse(_Schema):
+    answer: Optional[str] = None
+    checklist: List[Any] = []
+    disclaimer: Optional[str] = None
+    ask_location: bool = False
+
+class ClarifierResponse(_Schema):
+    clarifying_question: Optional[str] = None
+    suggested_agent: Optional[str] = None
+    confidence: float = 0.0
+
+    @validator("confidence", pre=True)
+    def _lenient_confidence(cls, value):
+        # "high", null and friends count as no confidence rather than an invalid reply
+        try:
+            return min(max(float(value), 0.0), 1.0)
+        except (TypeError, ValueError):
+            return 0.0
+
+SCHEMAS: Dict[str, Type[BaseModel]] = {
+    "agent_1": DiagnosisResponse,
+    "agent_2": TenancyResponse,
+    "fallback": ClarifierResponse,
+}
+
+class StructuredResponse(NamedTuple):
+    data: Optional[BaseModel]  # None when the completion is not a valid object for the schema
+    text: str                  # pretty-printed JSON, or the completion as received
+
+def extract_json(completion: str) -> Optional[Dict[str, Any]]:
+    text = _FENCE.sub("", (completion or "").strip())
+    try:
+        value = json.loads(text)
+    except ValueError:
+        # prose around the object: try the outermost braces
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end <= start:
+            return None
+        try:
+            value = json.loads(text[start:end + 1])
+        except ValueError:
+            return None
+    return value if isinstance(value, dict) else None
+
+def parse_completion(agent: str, completion: str) -> StructuredResponse:
+    obj = extract_json(completion)
+    if obj is None:
+        _parsed.inc(agent=agent, result="not_json")
+        return StructuredResponse(None, completion)
+    text = json.dumps(obj, ensure_ascii=False, indent=2)
+    try:
+        data = SCHEMAS[agent].parse_obj(obj)
+    except ValidationError:
+        _parsed.inc(agent=agent, result="invalid")
+        return StructuredResponse(None, text)
+    _parsed.inc(agent=agent, result="ok")
+    return StructuredResponse(data, text)
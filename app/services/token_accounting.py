@@ -0,0 +1,85 @@
+import os
+import threading
+from typing import Optional
+
+from app.services.metrics import counter, histogram
+
+LLM_DEFAULT_MODEL = "gpt-4o-mini"
+# the encoding used when tiktoken does not know the model (older tiktoken releases predate gpt-4o)
+TOKENIZER_FALLBACK_ENCODING = os.getenv("TOKENIZER_FALLBACK_ENCODING", "cl100k_base")
+
+_prompt_tokens = counter("llm_prompt_tokens_total", "Prompt tokens sent to the LLM", ["agent"])
+_completion_tokens = counter("llm_completion_tokens_total", "Completion tokens received from the LLM", ["agent"])
+_prompt_size = histogram("llm_prompt_tokens", "Prompt size per LLM call", ["agent"],
+                         buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192))
+
+_encodings: dict = {}
+_loading: set = set()
+_lock = threading.Lock()
+
+def _fetch(model: str):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(TOKENIZER_FALLBACK_ENCODING)
+    except Exception:
+        return None  # not installed, or offline with no cached BPE file
+
+def _load(model: str) -> None:
+    enc = _fetch(model)
+    with _lock:
+        _encodings[model] = enc
+        _loading.discard(model)
+
+def warm_tokenizer(model: str = LLM_DEFAULT_MODEL) -> bool:
+    """Load the encoding for ``model`` now; True when tiktoken is usable.
+
+    A cold tiktoken cache downloads the BPE file with no timeout, so call this
+    from a worker thread (the app does so at startup), never on the event loop."""
+    if model not in _encodings:
+        _load(model)
+    return _encodings[model] is not None
+
+def _encoding(model: str):
+    """tiktoken encoding for ``model``, or None while it is unavailable.
+
+    Never blocks: the first miss starts the load on a daemon thread and the
+    callers use the character estimate until it lands."""
+    if model in _encodings:
+        return _encodings[model]
+    with _lock:
+        if model not in _encodings and model not in _loading:
+            _loading.add(model)
+            threading.Thread(target=_load, args=(model,), name="tiktoken-load", daemon=True).start()
+    return _encodings.get(model)
+
+def count_tokens(text: str, model: str = LLM_DEFAULT_MODEL) -> int:
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is None:
+        # ~4 characters per token for English prose
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, budget: int, model: str = LLM_DEFAULT_MODEL, marker: str = " …[truncated]") -> str:
+    """``text`` cut to at most ``budget`` tokens (plus the marker), on a token boundary."""
+    # every token covers at least one character, so short text never needs encoding
+    if not text or budget <= 0 or len(text) <= budget:
+        return text
+    enc = _encoding(model)
+    if enc is None:
+        max_chars = budget * 4
+        return text if len(text) <= max_chars else text[:max_chars].rstrip() + marker
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= budget:
+        return text
+    return enc.decode(tokens[:budget]).rstrip() + marker
+
+def record_usage(agent: Optional[str], prompt_tokens: int, completion_tokens: int) -> None:
+    label = agent or "unknown"
+    _prompt_tokens.inc(prompt_tokens, agent=label)
+    _completion_tokens.inc(completion_tokens, agent=label)
+    _prompt_size.observe(prompt_tokens, agent=label)
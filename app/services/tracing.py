@@ -0,0 +1,131 @@
+"""Per-stage latency: spans, Prometheus histograms and Server-Timing.
+
+Every graph node and the expensive service calls (prompt rendering, BLIP
+decode/generate, the LLM) run inside ``span(stage)``. A span always
+observes ``stage_duration_seconds`` and, inside a request opened with
+``request_timings()``, adds its duration to that request's Server-Timing
+header. When the OpenTelemetry API is installed each span is also an
+OTel span; without a configured SDK those are no-ops, so exporting traces
+is a deployment choice (e.g. ``opentelemetry-instrument uvicorn ...``).
+"""
+import asyncio
+import functools
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.services.metrics import histogram
+
+TRACING_OTEL = os.getenv("TRACING_OTEL", "1") == "1"
+# Server-Timing exposes internal stage names and durations; turn off for untrusted clients
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "1") == "1"
+
+_stage_seconds = histogram("stage_duration_seconds", "Time spent per pipeline stage", ["stage", "agent"])
+_request_seconds = histogram("http_request_duration_seconds", "Time to the last response byte", ["route", "status"])
+
+# set per HTTP request; sync nodes see it too, since langgraph copies the context into its worker threads
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("stage_timings", default=None)
+
+_tracer: Any = None
+
+def _get_tracer():
+    global _tracer
+    if _tracer is None:
+        _tracer = False
+        if TRACING_OTEL:
+            try:
+                from opentelemetry import trace
+                _tracer = trace.get_tracer("realestatebot")
+            except ImportError:
+                pass
+    return _tracer or None
+
+@contextmanager
+def span(stage: str, agent: Optional[str] = None, **attributes: Any) -> Iterator[None]:
+    tracer = _get_tracer()
+    started = time.perf_counter()
+    try:
+        if tracer is None:
+            yield
+        else:
+            attrs = {k: v for k, v in attributes.items() if v is not None}
+            if agent:
+                attrs["agent"] = agent
+            with tracer.start_as_current_span(stage, attributes=attrs):
+                yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _stage_seconds.observe(elapsed, stage=stage, agent=agent or "")
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+def traced(stage: str, agent: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorator form of span() for sync and async functions alike."""
+    def decorate(fn: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage, agent):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage, agent):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+@contextmanager
+def request_timings() -> Iterator[List[Tuple[str, float]]]:
+    timings: List[Tuple[str, float]] = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+def server_timing(timings: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    # repeated stages (a retried LLM call, fallback then agent) are summed into one entry
+    totals: Dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    if total is not None:
+        totals["total"] = total
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+class ServerTimingMiddleware:
+    """Collects stage timings for each HTTP request and reports them in ``Server-Timing``.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streamed bodies pass through
+    untouched. Headers go out before a stream's body, so /chat/stream only
+    reports the stages that finished before its first event."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if SERVER_TIMING_HEADER:
+                    value = server_timing(timings, time.perf_counter() - started)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode("latin-1"))]
+            await send(message)
+
+        with request_timings() as timings:
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                route = scope.get("route")
+                _request_seconds.observe(time.perf_counter() - started,
+                                         route=getattr(route, "path", "unmatched"), status=str(status["code"]))
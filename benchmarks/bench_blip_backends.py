@@ -0,0 +1,149 @@
+"""Compare BLIP backends on caption latency, throughput, memory and agreement.
+
+    python -m benchmarks.bench_blip_backends --backends torch torch-int8 onnx --images 32 --batch-size 4
+    python -m benchmarks.bench_blip_backends --images-dir ~/photos --threads 4
+
+Each backend runs in its own subprocess so RSS numbers are not polluted by
+the others. Agreement is measured against the first backend listed:
+exact caption matches and mean word-level similarity (difflib ratio).
+Synthetic images are used unless --images-dir is given; real photos give
+far more meaningful agreement numbers.
+"""
+import argparse
+import difflib
+import json
+import os
+import subprocess
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import List
+
+from PIL import Image, ImageDraw
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _synthetic_images(n: int, size: int = 512) -> List[Image.Image]:
+    images = []
+    for i in range(n):
+        img = Image.new("RGB", (size, size), ((i * 37) % 255, (i * 91) % 255, (i * 53) % 255))
+        draw = ImageDraw.Draw(img)
+        for j in range(6):
+            x, y = (i * 67 + j * 89) % size, (i * 43 + j * 131) % size
+            draw.rectangle([x, y, x + size // 4, y + size // 6], fill=((j * 97) % 255, (i * 13) % 255, (j * 29) % 255))
+        images.append(img)
+    return images
+
+
+def _load_images(images_dir: str, n: int) -> List[Image.Image]:
+    if not images_dir:
+        return _synthetic_images(n)
+    paths = sorted(p for p in Path(images_dir).expanduser().iterdir()
+                   if p.suffix.lower() in {".jpg", ".jpeg", ".png", ".webp"})[:n]
+    images = []
+    for path in paths:
+        img = Image.open(path)
+        img.draft("RGB", (512, 512))
+        img = img.convert("RGB")
+        img.thumbnail((512, 512))
+        images.append(img)
+    return images
+
+
+def _worker(args: argparse.Namespace) -> None:
+    if args.threads:
+        os.environ["BLIP_NUM_THREADS"] = str(args.threads)
+    images = _load_images(args.images_dir, args.images)
+    from app.services.blip_backends import load_backend
+
+    rss_before = _rss_mb()
+    t0 = time.perf_counter()
+    backend = load_backend(args.worker)
+    load_s = time.perf_counter() - t0
+    backend.caption(images[:1])  # first call pays for lazy init / graph optimisation
+
+    single = []
+    captions = []
+    for img in images:
+        t0 = time.perf_counter()
+        captions.extend(backend.caption([img]))
+        single.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for i in range(0, len(images), args.batch_size):
+        backend.caption(images[i:i + args.batch_size])
+    batched_s = time.perf_counter() - t0
+
+    single.sort()
+    print(json.dumps({
+        "backend": args.worker,
+        "load_s": load_s,
+        "p50_ms": single[len(single) // 2] * 1000,
+        "p95_ms": single[min(len(single) - 1, int(len(single) * 0.95))] * 1000,
+        "single_img_s": len(images) / sum(single),
+        "batched_img_s": len(images) / batched_s,
+        "rss_mb": _rss_mb(),
+        "model_rss_mb": _rss_mb() - rss_before,
+        "captions": captions,
+    }))
+
+
+def _similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, a.split(), b.split()).ratio()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"])
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--images-dir", default="")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args)
+        return
+
+    results = []
+    for name in args.backends:
+        cmd = [sys.executable, "-m", "benchmarks.bench_blip_backends", "--worker", name,
+               "--images", str(args.images), "--batch-size", str(args.batch_size), "--threads", str(args.threads)]
+        if args.images_dir:
+            cmd += ["--images-dir", args.images_dir]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{name}: failed\n{proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else ''}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    if not results:
+        return
+    reference = results[0]["captions"]
+    print(f"{'backend':<11} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>7} {'batch img/s':>12} "
+          f"{'RSS MB':>8} {'model MB':>9} {'exact':>6} {'similar':>8}")
+    for r in results:
+        pairs = list(zip(reference, r["captions"]))
+        exact = sum(a == b for a, b in pairs) / max(1, len(pairs))
+        similar = sum(_similarity(a, b) for a, b in pairs) / max(1, len(pairs))
+        print(f"{r['backend']:<11} {r['load_s']:>7.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['single_img_s']:>7.2f} {r['batched_img_s']:>12.2f} {r['rss_mb']:>8.0f} "
+              f"{r['model_rss_mb']:>9.0f} {exact:>6.2f} {similar:>8.2f}")
+    print(f"agreement is measured against {results[0]['backend']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Compare single-image BLIP captioning with the micro-batching path.
+
+    python -m benchmarks.bench_blip_batching --images 64 --concurrency 16
+
+Both modes are driven by the same number of concurrent callers; the report
+shows images/sec and per-request p50/p99 latency.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from io import BytesIO
+from typing import List
+
+from PIL import Image
+
+from app.services import blip_captioner
+from app.services.blip_batcher import CaptionBatcher
+
+
+def _synthetic_images(n: int, size: int = 640) -> List[bytes]:
+    images = []
+    for i in range(n):
+        img = Image.new("RGB", (size, size), ((i * 37) % 255, (i * 91) % 255, (i * 53) % 255))
+        buf = BytesIO()
+        img.save(buf, "JPEG", quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+async def _drive(caption_fn, images: List[bytes], concurrency: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(img: bytes) -> None:
+        async with sem:
+            t0 = time.perf_counter()
+            await caption_fn(img)
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(img) for img in images))
+    wall = time.perf_counter() - t0
+    return {
+        "images_per_sec": len(images) / wall,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-batch-size", type=int, default=blip_captioner.BLIP_BATCH_MAX_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=blip_captioner.BLIP_BATCH_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    images = _synthetic_images(args.images)
+    blip_captioner._caption_uncached(images[0])  # load + warm the model outside the timings
+
+    loop = asyncio.get_running_loop()
+
+    async def single(img: bytes) -> str:
+        # bypass the caption cache so both modes pay for every generate
+        return await loop.run_in_executor(blip_captioner._executor, blip_captioner._caption_uncached, img)
+
+    batcher = CaptionBatcher(
+        blip_captioner.caption_image_batch,
+        blip_captioner._executor,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_concurrent_batches=blip_captioner.BLIP_MAX_WORKERS,
+    )
+
+    results = {
+        "single": await _drive(single, images, args.concurrency),
+        "batched": await _drive(batcher.caption, images, args.concurrency),
+    }
+    await batcher.close()
+
+    print(f"{'mode':<8} {'img/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<8} {r['images_per_sec']:>8.2f} {r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['mean_ms']:>9.1f}")
+    print(f"batches run: {batcher.batches_run} (avg size {batcher.images_run / max(1, batcher.batches_run):.1f})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
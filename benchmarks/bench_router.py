@@ -0,0 +1,111 @@
+"""Throughput of the compiled keyword router against the old substring scan.
+
+    python -m benchmarks.bench_router --texts 200000 --length 1
+
+--length repeats each synthetic sentence to model longer messages. The
+corpus mixes bare keywords, inflected and derived forms ("terminated",
+"tiling", "dampness", "windowsill") and substring traps ("current",
+"tapestry"). Every text the two routers disagree on is reported, grouped by
+old -> new route with the words responsible, so a routing regression shows up
+next to the speed numbers; --show-diffs prints example texts too.
+"""
+import argparse
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Tuple
+
+from app.router import _LEXICON, _WORD_RE, FAQ_KWS, ISSUE_KWS, classify_input
+
+_FILLER = (
+    "the my is a there in on near what can how do i should about please help with "
+    "current tapestry parental doorstep paintball drainage apparent frequent wallet "
+    "kitchen bathroom flat house apartment month week today yesterday london manchester"
+).split()
+_KEYWORDS = sorted(ISSUE_KWS | FAQ_KWS)
+_DERIVED = (
+    "walls doors windows ceilings leaked leaky mouldy moldy cracked peeled painted stained drained "
+    "tiled tiling tapped tapping plugged dampness leakage paintwork windowsill doorframe wallpaper "
+    "rented renting evicted leases contracts terminated terminating increased repairs tenants tenancies"
+).split()
+
+
+def legacy_classify(text: str) -> str:
+    t = (text or "").lower()
+    if not t:
+        return "fallback"
+    if any(kw in t for kw in ISSUE_KWS):
+        return "agent_1"
+    if any(kw in t for kw in FAQ_KWS):
+        return "agent_2"
+    return "fallback"
+
+
+def synthetic_corpus(n: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        words = rng.choices(_FILLER, k=rng.randint(6, 40))
+        r = rng.random()
+        if r < 0.4:
+            words.insert(rng.randrange(len(words)), rng.choice(_KEYWORDS))
+        elif r < 0.6:
+            words.insert(rng.randrange(len(words)), rng.choice(_DERIVED))
+        corpus.append(" ".join(words).capitalize() + "?")
+    return corpus
+
+
+def _time(fn: Callable[[str], str], corpus: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for text in corpus:
+            fn(text)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def routing_diffs(corpus: List[str]) -> Dict[Tuple[str, str], List[str]]:
+    diffs: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+    for text in corpus:
+        old, new = legacy_classify(text), classify_input(text)
+        if old != new:
+            diffs[(old, new)].append(text)
+    return diffs
+
+
+def _culprits(texts: List[str], limit: int = 8) -> str:
+    # words only one of the two matchers counts: substring hits missing from the lexicon, or the reverse
+    words = Counter(w for t in texts for w in set(_WORD_RE.findall(t.lower()))
+                    if (w in _LEXICON) != any(kw in w for kw in _KEYWORDS))
+    return ", ".join(f"{w}({n})" for w, n in words.most_common(limit))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--texts", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--length", type=int, default=1)
+    parser.add_argument("--show-diffs", type=int, default=0, metavar="N", help="print N example texts per diff")
+    args = parser.parse_args()
+
+    corpus = [" ".join([t] * args.length) for t in synthetic_corpus(args.texts)]
+    mb = sum(len(t) for t in corpus) / 1e6
+
+    legacy = _time(legacy_classify, corpus, args.repeat)
+    compiled = _time(classify_input, corpus, args.repeat)
+    diffs = routing_diffs(corpus)
+    disagreements = sum(len(texts) for texts in diffs.values())
+
+    print(f"{'router':<10} {'texts/s':>12} {'MB/s':>8} {'us/text':>9}")
+    for name, secs in (("substring", legacy), ("compiled", compiled)):
+        print(f"{name:<10} {len(corpus) / secs:>12,.0f} {mb / secs:>8.1f} {secs / len(corpus) * 1e6:>9.2f}")
+    print(f"compiled/substring throughput: {legacy / compiled:.2f}x  routing changes: {disagreements}/{len(corpus)}")
+    for (old, new), texts in sorted(diffs.items(), key=lambda item: -len(item[1])):
+        print(f"  {old:>8} -> {new:<8} {len(texts):>8}  {_culprits(texts)}")
+        for text in texts[:args.show_diffs]:
+            print(f"      {text[:120]}")
+
+
+if __name__ == "__main__":
+    main()
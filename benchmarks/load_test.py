@@ -0,0 +1,393 @@
+"""Drive /chat with a synthetic text and image mix and compare against a stored baseline.
+
+    python -m benchmarks.load_test --spawn --requests 500 --concurrency 16 --image-ratio 0.2
+    python -m benchmarks.load_test --spawn --save-baseline           # on the reference machine
+    python -m benchmarks.load_test --spawn --compare                 # exits 1 on a regression
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --server-pid 1234
+
+--spawn starts benchmarks/mock_openai_server.py and the API under uvicorn,
+pointed at each other, so no OpenAI key or network is needed. Image
+requests still need the BLIP weights in the local Hugging Face cache; use
+--image-ratio 0 where they are not available. Without --spawn, point --url
+at a running server and pass --server-pid to sample its RSS.
+
+The report has throughput, p50/p95/p99 latency overall and per request
+kind, error counts and the server's RSS over time (Linux only, the whole
+process tree, so every uvicorn worker counts). Baselines are plain JSON.
+A metric regresses when it is worse than the baseline by more than
+--tolerance. Latency and RSS may only grow by that much and throughput
+may only shrink by that much. Compare runs from the same machine and the
+same settings; the baseline records the settings it was taken with.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from PIL import Image, ImageDraw
+
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baselines" / "load_test.json"
+
+_FAQ = [
+    "How much notice do I need to give before vacating?",
+    "What should I do if the landlord is not returning my deposit?",
+    "Can my landlord raise the rent in the middle of a fixed term?",
+    "Who is responsible for repairing the boiler?",
+    "Is my landlord allowed to enter without telling me?",
+    "Can I be evicted without a court order?",
+]
+_ISSUE = [
+    "There is a damp patch spreading on the ceiling",
+    "The bathroom tiles are cracking, what is it?",
+    "What is this stain near the window?",
+    "The paint is peeling off the wall",
+]
+_VAGUE = ["hey can you help?", "hello", "I have a question", "not sure who to ask about this"]
+_PLACES = ["London", "Manchester", "Mumbai", "Berlin", "", "Toronto"]
+
+
+def _synthetic_corpus(n: int, seed: int) -> List[bytes]:
+    """Deterministic photo-sized JPEGs and PNGs with shapes on a gradient, so the decode path does real work."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(n):
+        w, h = rng.choice([(640, 480), (1280, 960), (2048, 1536), (1080, 1920), (4000, 3000)])
+        img = Image.linear_gradient("L").resize((w, h)).convert("RGB")
+        draw = ImageDraw.Draw(img)
+        for _ in range(12):
+            x0, y0 = rng.randrange(w), rng.randrange(h)
+            box = [x0, y0, x0 + rng.randrange(20, w // 3), y0 + rng.randrange(20, h // 3)]
+            color = tuple(rng.randrange(256) for _ in range(3))
+            (draw.ellipse if rng.random() < 0.5 else draw.rectangle)(box, fill=color)
+        buf = BytesIO()
+        if i % 4 == 3:
+            img.save(buf, "PNG")
+        else:
+            img.save(buf, "JPEG", quality=rng.choice([75, 85, 95]))
+        corpus.append(buf.getvalue())
+    return corpus
+
+
+def _load_corpus(images_dir: str) -> List[bytes]:
+    paths = sorted(p for p in Path(images_dir).expanduser().iterdir()
+                   if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"))
+    return [p.read_bytes() for p in paths]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def _tree_rss_mb(pid: int) -> Optional[float]:
+    """RSS of ``pid`` and all its descendants, from /proc; None where that is unavailable."""
+    total_kb, stack, seen = 0, [pid], set()
+    while stack:
+        current = stack.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        try:
+            with open(f"/proc/{current}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as fh:
+                    stack.extend(int(c) for c in fh.read().split())
+        except (OSError, ValueError):
+            if current == pid:
+                return None
+    return total_kb / 1024.0
+
+
+class _Plan:
+    """The request sequence, fixed by the seed so every run sends the same traffic."""
+
+    def __init__(self, n: int, image_ratio: float, vague_ratio: float, sessions: int, corpus: List[bytes], seed: int):
+        rng = random.Random(seed)
+        self.requests: List[Tuple[str, dict, Optional[bytes]]] = []
+        for i in range(n):
+            session = f"load-{rng.randrange(sessions)}"
+            place = rng.choice(_PLACES)
+            roll = rng.random()
+            if corpus and roll < image_ratio:
+                kind, text, image = "image", rng.choice(_ISSUE), corpus[i % len(corpus)]
+            elif roll < image_ratio + vague_ratio:
+                kind, text, image = "vague", rng.choice(_VAGUE), None
+            else:
+                kind, text, image = "text", rng.choice(_FAQ), None
+            self.requests.append((kind, {"session_id": session, "text": text, "location": place}, image))
+
+
+async def _run_load(url: str, plan: _Plan, concurrency: int, no_cache: bool, server_pid: Optional[int],
+                    rss_interval: float, timeout: float) -> dict:
+    latencies: Dict[str, List[float]] = {}
+    statuses: Dict[str, int] = {}
+    rss: List[Tuple[float, float]] = []
+    queue: "asyncio.Queue[Tuple[str, dict, Optional[bytes]]]" = asyncio.Queue()
+    for item in plan.requests:
+        queue.put_nowait(item)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def worker() -> None:
+            while True:
+                try:
+                    kind, data, image = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if no_cache:
+                    data = dict(data, no_cache="true")
+                files = {"image": ("load.jpg", image, "application/octet-stream")} if image else None
+                t0 = time.perf_counter()
+                try:
+                    resp = await client.post("/chat", data=data, files=files)
+                    status = str(resp.status_code)
+                except httpx.HTTPError as exc:
+                    status = exc.__class__.__name__
+                elapsed = time.perf_counter() - t0
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == "200":
+                    latencies.setdefault(kind, []).append(elapsed)
+
+        async def sample_rss(started: float) -> None:
+            while True:
+                value = _tree_rss_mb(server_pid)
+                if value is not None:
+                    rss.append((round(time.perf_counter() - started, 2), round(value, 1)))
+                await asyncio.sleep(rss_interval)
+
+        started = time.perf_counter()
+        sampler = asyncio.ensure_future(sample_rss(started)) if server_pid else None
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            if sampler is not None:
+                sampler.cancel()
+        wall = time.perf_counter() - started
+        if server_pid:
+            value = _tree_rss_mb(server_pid)
+            if value is not None:
+                rss.append((round(wall, 2), round(value, 1)))
+
+    def summary(values: List[float]) -> dict:
+        return {
+            "count": len(values),
+            "p50_ms": round(_percentile(values, 50) * 1000, 1),
+            "p95_ms": round(_percentile(values, 95) * 1000, 1),
+            "p99_ms": round(_percentile(values, 99) * 1000, 1),
+        }
+
+    ok = [v for values in latencies.values() for v in values]
+    rss_values = [v for _, v in rss]
+    return {
+        "wall_s": round(wall, 2),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "latency": summary(ok),
+        "by_kind": {kind: summary(values) for kind, values in sorted(latencies.items())},
+        "statuses": statuses,
+        "rss_mb": {
+            "start": rss_values[0] if rss_values else None,
+            "peak": max(rss_values) if rss_values else None,
+            "end": rss_values[-1] if rss_values else None,
+            "series": rss,
+        },
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def _spawn(args: argparse.Namespace, workdir: str) -> Tuple[str, List[subprocess.Popen]]:
+    mock_port, api_port = _free_port(), _free_port()
+    mock = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.mock_openai_server", "--port", str(mock_port),
+        "--latency-ms", str(args.llm_latency_ms), "--jitter-ms", str(args.llm_jitter_ms),
+        "--tokens-per-sec", str(args.llm_tokens_per_sec), "--seed", str(args.seed),
+    ])
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=f"http://127.0.0.1:{mock_port}/v1",
+        OPENAI_API_KEY="mock",
+        RATE_LIMIT_ENABLED="0",  # every request comes from one IP and a few sessions
+        FEEDBACK_LOG_PATH=os.path.join(workdir, "feedback.jsonl"),
+        FEEDBACK_DB_PATH="",
+        SESSION_DB_PATH=os.path.join(workdir, "sessions.sqlite3"),
+    )
+    api = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(api_port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ], env=env)
+    procs = [api, mock]
+    try:
+        _wait_for(f"http://127.0.0.1:{mock_port}/stats", 30)
+        _wait_for(f"http://127.0.0.1:{api_port}/ready", args.startup_timeout)
+    except Exception:
+        _stop(procs)
+        raise
+    return f"http://127.0.0.1:{api_port}", procs
+
+
+def _stop(procs: List[subprocess.Popen]) -> None:
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def _regressions(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    found = []
+
+    def worse(label: str, now: Optional[float], then: Optional[float], higher_is_worse: bool = True) -> None:
+        if not now or not then:
+            return
+        change = (now - then) / then
+        flagged = change > tolerance if higher_is_worse else -change > tolerance
+        marker = "REGRESSION" if flagged else "ok"
+        print(f"  {label:<24} {then:>10.1f} -> {now:>10.1f}  ({change:+.1%})  {marker}")
+        if flagged:
+            found.append(label)
+
+    print(f"compared with baseline from {baseline.get('recorded_at', '?')} (tolerance {tolerance:.0%}):")
+    if baseline.get("note"):
+        print(f"  baseline note: {baseline['note']}")
+    worse("throughput_rps", current["throughput_rps"], baseline["throughput_rps"], higher_is_worse=False)
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        worse(f"latency.{key}", current["latency"][key], baseline["latency"][key])
+    for kind, stats in current["by_kind"].items():
+        then = baseline.get("by_kind", {}).get(kind)
+        if then:
+            worse(f"{kind}.p95_ms", stats["p95_ms"], then["p95_ms"])
+    worse("rss_mb.peak", current["rss_mb"]["peak"], baseline.get("rss_mb", {}).get("peak"))
+    if current["config"] != baseline.get("config"):
+        print("  note: settings differ from the baseline's, so the comparison is only indicative")
+    return found
+
+
+def _print_report(result: dict) -> None:
+    lat = result["latency"]
+    print(f"{result['latency']['count']} ok in {result['wall_s']:.1f}s: {result['throughput_rps']:.1f} req/s, "
+          f"p50 {lat['p50_ms']:.0f} ms, p95 {lat['p95_ms']:.0f} ms, p99 {lat['p99_ms']:.0f} ms")
+    for kind, stats in result["by_kind"].items():
+        print(f"  {kind:<6} n={stats['count']:<5} p50 {stats['p50_ms']:>7.0f}  p95 {stats['p95_ms']:>7.0f}  "
+              f"p99 {stats['p99_ms']:>7.0f} ms")
+    print(f"  statuses: {result['statuses']}")
+    rss = result["rss_mb"]
+    if rss["peak"] is not None:
+        print(f"  server RSS MB: start {rss['start']:.0f}, peak {rss['peak']:.0f}, end {rss['end']:.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--spawn", action="store_true", help="start the mock LLM and the API locally")
+    parser.add_argument("--server-pid", type=int, help="sample this process tree's RSS (implied by --spawn)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent first and left out of the report")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--image-ratio", type=float, default=0.2)
+    parser.add_argument("--vague-ratio", type=float, default=0.1, help="share of messages that go to the clarifier")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--images", type=int, default=16, help="size of the synthetic image corpus")
+    parser.add_argument("--images-dir", default="")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the response cache on every request")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--rss-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_out", help="also write the full result to this file")
+    parser.add_argument("--save-baseline", nargs="?", const=str(DEFAULT_BASELINE))
+    parser.add_argument("--compare", nargs="?", const=str(DEFAULT_BASELINE))
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--note", default="", help="free-text environment note stored with the result")
+    args = parser.parse_args()
+
+    corpus: List[bytes] = []
+    if args.image_ratio > 0:
+        corpus = _load_corpus(args.images_dir) if args.images_dir else _synthetic_corpus(args.images, args.seed)
+    config = {k: getattr(args, k) for k in (
+        "workers", "requests", "concurrency", "image_ratio", "vague_ratio", "sessions", "images", "images_dir",
+        "no_cache", "llm_latency_ms", "llm_jitter_ms", "llm_tokens_per_sec", "seed")}
+    if not args.spawn:
+        config["url"] = args.url
+
+    procs: List[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory(prefix="load-test-") as workdir:
+        url, server_pid = args.url, args.server_pid
+        if args.spawn:
+            url, procs = _spawn(args, workdir)
+            server_pid = procs[0].pid
+        try:
+            if args.warmup:
+                warm = _Plan(args.warmup, args.image_ratio, args.vague_ratio, args.sessions, corpus, args.seed + 1)
+                asyncio.run(_run_load(url, warm, args.concurrency, args.no_cache, None, args.rss_interval, args.timeout))
+            plan = _Plan(args.requests, args.image_ratio, args.vague_ratio, args.sessions, corpus, args.seed)
+            result = asyncio.run(_run_load(url, plan, args.concurrency, args.no_cache, server_pid,
+                                           args.rss_interval, args.timeout))
+        finally:
+            _stop(procs)
+
+    result.update({
+        "config": config,
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+    })
+    if args.note:
+        result["note"] = args.note
+    _print_report(result)
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(result, indent=2))
+    if args.save_baseline:
+        path = Path(args.save_baseline)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(result, indent=2))
+        print(f"baseline saved to {path}")
+    if args.compare:
+        path = Path(args.compare)
+        if not path.exists():
+            sys.exit(f"no baseline at {path}; record one with --save-baseline")
+        if _regressions(result, json.loads(path.read_text()), args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
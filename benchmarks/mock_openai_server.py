@@ -0,0 +1,142 @@
+"""Local OpenAI-compatible chat completions server with injectable latency and faults.
+
+    python -m benchmarks.mock_openai_server --port 8001 --latency-ms 400 --jitter-ms 200 --error-rate 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock uvicorn app.main:app
+
+--error-rate answers with 500 or 429 (half each, 429 with a Retry-After),
+--stall-rate holds the request for --stall-ms to exercise deadlines and
+hedging. Streaming responses emit the reply a word at a time, --token-ms
+apart. --tokens-per-sec paces generation for both modes instead, so
+non-streaming calls also pay for the length of the reply. Each reply is the
+JSON shape the prompting agent expects, and usage is filled in from the
+prompt and reply sizes.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_REPLIES = {
+    "agent_1": json.dumps({
+        "issue": "Mock diagnosis: water staining below the window frame.",
+        "reasoning": "This reply comes from benchmarks/mock_openai_server.py.",
+        "recommendations": {"steps": ["Dry the area", "Check the seal"], "who_to_contact": ["Landlord"]},
+        "follow_up_question": "Is the stain growing?",
+    }),
+    "agent_2": json.dumps({
+        "answer": "Mock answer: check your tenancy agreement for the notice period.",
+        "checklist": ["Read the agreement", "Give notice in writing"],
+        "disclaimer": "This reply comes from benchmarks/mock_openai_server.py.",
+        "ask_location": False,
+    }),
+    "fallback": json.dumps({
+        "clarifying_question": "Is this about a problem in the property or about your tenancy?",
+        "suggested_agent": "agent_2",
+        "confidence": 0.5,
+    }),
+}
+
+def _reply_for(messages: list) -> str:
+    prompt = " ".join(str(m.get("content") or "") for m in messages)
+    if "clarifying question" in prompt:
+        return _REPLIES["fallback"]
+    if "IMAGE_DESCRIPTION" in prompt:
+        return _REPLIES["agent_1"]
+    return _REPLIES["agent_2"]
+
+def _usage(messages: list, reply: str) -> dict:
+    prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4
+    completion_tokens = len(reply) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def create_app(latency_ms: float, jitter_ms: float, error_rate: float, stall_rate: float,
+               stall_ms: float, token_ms: float, seed: int = 0, tokens_per_sec: float = 0.0) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(seed)
+    app.state.requests = 0
+    app.state.tokens = 0
+    if tokens_per_sec > 0:
+        token_ms = 1000.0 / tokens_per_sec
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        roll = rng.random()
+        if roll < error_rate / 2:
+            return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}}, status_code=500)
+        if roll < error_rate:
+            return JSONResponse({"error": {"message": "injected rate limit", "type": "rate_limit"}},
+                                status_code=429, headers={"retry-after": "0.2"})
+        delay = latency_ms + rng.uniform(0, jitter_ms)
+        if rng.random() < stall_rate:
+            delay = stall_ms
+        await asyncio.sleep(delay / 1000.0)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model", "mock")
+        messages = body.get("messages") or []
+        reply = _reply_for(messages)
+        usage = _usage(messages, reply)
+        app.state.tokens += usage["total_tokens"]
+        if not body.get("stream"):
+            if tokens_per_sec > 0:
+                await asyncio.sleep(usage["completion_tokens"] / tokens_per_sec)
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": reply}}],
+                "usage": usage,
+            }
+
+        async def events():
+            words = reply.split(" ")
+            for i, word in enumerate(words):
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": None,
+                                 "delta": {"content": word if i == 0 else " " + word}}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(token_ms / 1000.0)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests, "tokens": app.state.tokens}
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-ms", type=float, default=10_000)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.stall_rate,
+                     args.stall_ms, args.token_ms, args.seed, args.tokens_per_sec)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
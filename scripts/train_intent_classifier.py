@@ -0,0 +1,115 @@
+"""Train and evaluate the local intent classifier from feedback logs.
+
+    python -m scripts.train_intent_classifier app/feedback_log.jsonl --out app/models/intent_classifier.npz
+
+Every text-only turn in the logs is a (text, agent) example. Turns routed
+because a photo was attached say nothing about the text, so they are
+skipped. With --use-suggestions, fallback turns whose clarifier named a
+suggested_agent are labelled with that suggestion.
+"""
+import argparse
+import random
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from app.feedback.feedback_store import read_jsonl
+from app.services.intent_classifier import INTENT_CONFIDENCE_THRESHOLD, INTENT_MODEL_PATH, IntentClassifier
+from app.services.structured_output import parse_completion
+
+
+def _suggested_agent(response: str) -> str:
+    data = parse_completion("fallback", response or "").data
+    return (data.suggested_agent or "") if data is not None else ""
+
+
+def load_examples(paths: List[Path], use_suggestions: bool) -> List[Tuple[str, str]]:
+    examples = []
+    for path in paths:
+        for record in read_jsonl(path):
+            text = (record.get("input_text") or "").strip()
+            agent = record.get("agent")
+            if not text or text == "string" or record.get("image_caption"):
+                continue
+            if agent == "fallback" and use_suggestions:
+                agent = _suggested_agent(record.get("response")) or agent
+            if agent in {"agent_1", "agent_2", "fallback"}:
+                examples.append((text, agent))
+    return examples
+
+
+def evaluate(model: IntentClassifier, examples: List[Tuple[str, str]], threshold: float) -> None:
+    confusion: Counter = Counter()
+    confident = confident_correct = 0
+    for text, label in examples:
+        pred = model.predict(text)
+        confusion[(label, pred.agent)] += 1
+        if pred.confidence >= threshold:
+            confident += 1
+            confident_correct += pred.agent == label
+    total = len(examples)
+    correct = sum(n for (label, pred), n in confusion.items() if label == pred)
+    print(f"accuracy: {correct}/{total} = {correct / max(1, total):.3f}")
+    print(f"confident (>= {threshold}): {confident}/{total}, accuracy {confident_correct / max(1, confident):.3f}")
+    for cls in model.classes:
+        tp = confusion[(cls, cls)]
+        predicted = sum(n for (_, p), n in confusion.items() if p == cls)
+        actual = sum(n for (l, _), n in confusion.items() if l == cls)
+        print(f"  {cls:<9} precision {tp / max(1, predicted):.3f}  recall {tp / max(1, actual):.3f}  support {actual}")
+
+
+def measure_latency(model: IntentClassifier, texts: List[str], rounds: int = 2000) -> None:
+    samples = []
+    for i in range(rounds):
+        text = texts[i % len(texts)]
+        t0 = time.perf_counter()
+        model.predict(text)
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    print(f"inference: mean {np.mean(samples) * 1e6:.1f}us  p50 {samples[len(samples) // 2] * 1e6:.1f}us  "
+          f"p99 {samples[int(len(samples) * 0.99)] * 1e6:.1f}us")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("logs", nargs="+", type=Path)
+    parser.add_argument("--out", type=Path, default=INTENT_MODEL_PATH)
+    parser.add_argument("--bits", type=int, default=16)
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--threshold", type=float, default=INTENT_CONFIDENCE_THRESHOLD)
+    parser.add_argument("--use-suggestions", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    examples = load_examples(args.logs, args.use_suggestions)
+    if not examples:
+        raise SystemExit("no usable text-only turns in the given logs")
+    print(f"examples: {len(examples)}  labels: {dict(Counter(label for _, label in examples))}")
+
+    random.Random(args.seed).shuffle(examples)
+    n_eval = int(len(examples) * args.holdout)
+    train, held_out = examples[n_eval:], examples[:n_eval]
+    classes = sorted({label for _, label in examples})
+
+    model = IntentClassifier(classes, args.bits).fit(
+        [t for t, _ in train], [label for _, label in train], epochs=args.epochs, seed=args.seed
+    )
+    if held_out:
+        print("held-out evaluation:")
+        evaluate(model, held_out, args.threshold)
+
+    # ship a model trained on everything
+    model = IntentClassifier(classes, args.bits).fit(
+        [t for t, _ in examples], [label for _, label in examples], epochs=args.epochs, seed=args.seed
+    )
+    measure_latency(model, [t for t, _ in examples])
+    model.save(args.out)
+    print(f"saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ from pathlib import Path
 # ------------------------------
 BACKEND_URL_DEFAULT = os.getenv("ST_BACKEND_URL", "http://127.0.0.1:8000")
 CHAT_ENDPOINT_PATH = "/chat"
+FEEDBACK_ENDPOINT_PATH = "/feedback"
 PERSIST_DIR = Path(os.getenv("ST_CHAT_DIR", ".chats"))
 PERSIST_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -150,24 +151,24 @@ for i, m in enumerate(st.session_state.messages):
             # Feedback row
             cols = st.columns(3)
             with cols[0]:
-                if st.button("👍 Helpful", key=f"up_{i}"):
+                if st.button("👍 Helpful", key=f"up_{i}", disabled=not m.get("turn_id")):
                     try:
                         requests.post(
-                            st.session_state.backend_url + CHAT_ENDPOINT_PATH,
-                            data={"session_id": st.session_state.session_id, "text": "", "feedback": "up"},
-                            timeout=15,
-                        )
+                            st.session_state.backend_url + FEEDBACK_ENDPOINT_PATH,
+                            data={"session_id": st.session_state.session_id, "turn_id": m["turn_id"], "rating": "up"},
+                            timeout=5,
+                        ).raise_for_status()
                         st.success("Thanks for the feedback!")
                     except Exception as e:
                         st.error(f"Feedback failed: {e}")
             with cols[1]:
-                if st.button("👎 Not helpful", key=f"down_{i}"):
+                if st.button("👎 Not helpful", key=f"down_{i}", disabled=not m.get("turn_id")):
                     try:
                         requests.post(
-                            st.session_state.backend_url + CHAT_ENDPOINT_PATH,
-                            data={"session_id": st.session_state.session_id, "text": "", "feedback": "down"},
-                            timeout=15,
-                        )
+                            st.session_state.backend_url + FEEDBACK_ENDPOINT_PATH,
+                            data={"session_id": st.session_state.session_id, "turn_id": m["turn_id"], "rating": "down"},
+                            timeout=5,
+                        ).raise_for_status()
                         st.success("We appreciate the signal.")
                     except Exception as e:
                         st.error(f"Feedback failed: {e}")
@@ -231,6 +232,7 @@ if user_text is not None:
         "content": display_text,
         "agent": res.get("agent"),
         "caption": res.get("caption"),
+        "turn_id": res.get("turn_id"),
         "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "image_name": None,
     }
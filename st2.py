@@ -13,6 +13,8 @@ from pathlib import Path
 # =============================
 BACKEND_URL_DEFAULT = os.getenv("ST_BACKEND_URL", "http://127.0.0.1:8000")
 CHAT_ENDPOINT_PATH = "/chat"
+FEEDBACK_ENDPOINT_PATH = "/feedback"
+STREAM_ENDPOINT_PATH = "/chat/stream"
 PERSIST_DIR = Path(os.getenv("ST_CHAT_DIR", ".chats"))
 PERSIST_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -101,6 +103,7 @@ with st.sidebar:
     st.write("Session:", st.session_state.session_id)
     st.toggle("Dark mode", key="dark_mode")
     show_raw = st.toggle("Show raw JSON (dev)", value=False)
+    stream_mode = st.toggle("Stream responses", value=True)
     if st.button("🧹 New chat"):
         st.session_state.session_id = str(int(time.time()*1000))
         st.session_state.messages = []
@@ -150,18 +153,20 @@ def _strip_code_fences(text: str) -> str:
     return t.strip()
 
 
-def render_pretty(agent: str, raw: str) -> str:
-    """Convert JSON-ish responses into human-friendly chat text."""
-    if not raw:
+def render_pretty(agent: str, raw: str, data=None) -> str:
+    """Convert JSON-ish responses into human-friendly chat text.
+
+    `data` is the backend's already-parsed object; the raw string is only
+    parsed here when talking to a backend that doesn't send it."""
+    if not raw and not data:
         return ""
     cleaned = _strip_code_fences(raw)
 
-    # Try JSON
-    data = None
-    try:
-        data = json.loads(cleaned)
-    except Exception:
-        data = None
+    if not isinstance(data, dict):
+        try:
+            data = json.loads(cleaned)
+        except Exception:
+            data = None
 
     if isinstance(data, dict):
         if agent == "agent_1":
@@ -219,6 +224,43 @@ def call_backend(text: str, location: str, image_file) -> dict:
     resp.raise_for_status()
     return resp.json()
 
+
+def _iter_sse(resp):
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].lstrip())
+
+
+def call_backend_stream(text: str, location: str, image_file, on_event) -> dict:
+    """Same contract as call_backend, but consumes /chat/stream and calls
+    on_event(event, data) for every agent/caption/token event along the way."""
+    data = {
+        "session_id": st.session_state.session_id,
+        "text": text or "",
+        "location": location or "",
+    }
+    files = None
+    if image_file is not None:
+        files = {"image": (image_file.name, image_file.getvalue(), image_file.type or "application/octet-stream")}
+    with requests.post(st.session_state.backend_url + STREAM_ENDPOINT_PATH, data=data, files=files, timeout=90, stream=True) as resp:
+        resp.raise_for_status()
+        for event, payload in _iter_sse(resp):
+            if event == "done":
+                return payload
+            if event == "error":
+                raise RuntimeError(payload.get("detail") or "stream failed")
+            on_event(event, payload)
+    raise RuntimeError("stream ended before the response was complete")
+
 # =============================
 # Render history
 # =============================
@@ -252,24 +294,24 @@ for i, m in enumerate(st.session_state.messages):
                 st.markdown(f"<div class='caption'><b>Caption:</b> {caption}</div>", unsafe_allow_html=True)
             cols = st.columns(3)
             with cols[0]:
-                if st.button("👍 Helpful", key=f"up_{i}"):
+                if st.button("👍 Helpful", key=f"up_{i}", disabled=not m.get("turn_id")):
                     try:
                         requests.post(
-                            st.session_state.backend_url + CHAT_ENDPOINT_PATH,
-                            data={"session_id": st.session_state.session_id, "text": "", "feedback": "up"},
-                            timeout=15,
-                        )
+                            st.session_state.backend_url + FEEDBACK_ENDPOINT_PATH,
+                            data={"session_id": st.session_state.session_id, "turn_id": m["turn_id"], "rating": "up"},
+                            timeout=5,
+                        ).raise_for_status()
                         st.success("Thanks for the feedback!")
                     except Exception as e:
                         st.error(f"Feedback failed: {e}")
             with cols[1]:
-                if st.button("👎 Not helpful", key=f"down_{i}"):
+                if st.button("👎 Not helpful", key=f"down_{i}", disabled=not m.get("turn_id")):
                     try:
                         requests.post(
-                            st.session_state.backend_url + CHAT_ENDPOINT_PATH,
-                            data={"session_id": st.session_state.session_id, "text": "", "feedback": "down"},
-                            timeout=15,
-                        )
+                            st.session_state.backend_url + FEEDBACK_ENDPOINT_PATH,
+                            data={"session_id": st.session_state.session_id, "turn_id": m["turn_id"], "rating": "down"},
+                            timeout=5,
+                        ).raise_for_status()
                         st.success("We appreciate the signal.")
                     except Exception as e:
                         st.error(f"Feedback failed: {e}")
@@ -337,8 +379,28 @@ if user_text is not None:
 
     # backend
     try:
-        with st.spinner("Thinking…"):
-            res = call_backend(user_text, location, upload_slot)
+        if stream_mode:
+            live = {"agent": None, "caption": None, "text": ""}
+
+            def _on_event(event, payload):
+                if event == "token":
+                    live["text"] += payload.get("text", "")
+                else:
+                    if event == "agent" and payload.get("agent") != live["agent"]:
+                        live["text"] = ""  # re-routed: the next agent streams its own answer
+                    live.update(payload)
+                meta = []
+                if live["agent"]: meta.append(f"Agent: {live['agent']}")
+                if live["caption"]: meta.append(f"Caption: {live['caption']}")
+                with placeholder.container():
+                    if meta:
+                        st.caption(" • ".join(meta))
+                    st.markdown(live["text"] or "🟢 **Assistant is typing…**")
+
+            res = call_backend_stream(user_text, location, upload_slot, _on_event)
+        else:
+            with st.spinner("Thinking…"):
+                res = call_backend(user_text, location, upload_slot)
         st.toast("Response ready ✅", icon="✅")
     except Exception as e:
         st.toast("Request failed", icon="❌")
@@ -346,13 +408,14 @@ if user_text is not None:
 
     # assistant turn
     raw = res.get("response") or ""
-    pretty = raw if show_raw else render_pretty(res.get("agent"), raw)
+    pretty = raw if show_raw else render_pretty(res.get("agent"), raw, res.get("data"))
 
     msg_bot = {
         "role": "assistant",
         "content": pretty,
         "agent": res.get("agent"),
         "caption": res.get("caption"),
+        "turn_id": res.get("turn_id"),
         "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
     }
     st.session_state.messages.append(msg_bot)
@@ -56,6 +56,11 @@ def call_backend(text: str, location: str, feedback: str, image_file) -> dict:
     resp.raise_for_status()
     return resp.json()
 
+def send_rating(rating: str) -> None:
+    url = f"{st.session_state.backend if 'backend' in st.session_state else BACKEND_URL}/feedback"
+    data = {"session_id": sid, "turn_id": st.session_state.last_response["turn_id"], "rating": rating}
+    requests.post(url, data=data, timeout=5).raise_for_status()
+
 send = st.button("🚀 Send")
 
 if send:
@@ -83,7 +88,7 @@ if "last_response" in st.session_state:
     # Try pretty JSON first
     raw = res.get("response") or ""
     try:
-        st.json(json.loads(raw))
+        st.json(res.get("data") or json.loads(raw))
     except Exception:
         st.write(raw)
 
@@ -91,16 +96,16 @@ if "last_response" in st.session_state:
     st.subheader("👍 Quick Feedback")
     fb_cols = st.columns(3)
     with fb_cols[0]:
-        if st.button("👍 Helpful"):
+        if st.button("👍 Helpful", disabled=not res.get("turn_id")):
             try:
-                call_backend("", location, "up", None)
+                send_rating("up")
                 st.success("Thanks for the feedback!")
             except Exception as e:
                 st.error(f"Feedback failed: {e}")
     with fb_cols[1]:
-        if st.button("👎 Not helpful"):
+        if st.button("👎 Not helpful", disabled=not res.get("turn_id")):
             try:
-                call_backend("", location, "down", None)
+                send_rating("down")
                 st.success("Thanks, we will use this to improve.")
             except Exception as e:
                 st.error(f"Feedback failed: {e}")
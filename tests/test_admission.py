@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from app.services import admission
+from app.services.admission import ConcurrencyLimiter, Overloaded, TokenBucketLimiter
+
+
+def test_session_rejection_does_not_spend_the_ip_budget(monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(admission, "_ip_buckets", TokenBucketLimiter(per_minute=0, burst=2))
+    monkeypatch.setattr(admission, "_session_buckets", TokenBucketLimiter(per_minute=0, burst=1))
+
+    assert admission.check_rate_limit("s1", "10.0.0.1") == 0
+    assert admission.check_rate_limit("s1", "10.0.0.1") > 0  # session bucket empty
+    # the refused request gave its IP token back, so another session from the same IP still fits
+    assert admission.check_rate_limit("s2", "10.0.0.1") == 0
+    assert admission.check_rate_limit("s3", "10.0.0.1") > 0
+
+
+def test_waiting_tracks_queued_and_departed_callers():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", slots=1, max_queue=1, max_wait=0.05)
+        async with limiter.slot():
+            queued = asyncio.ensure_future(limiter._acquire())
+            await asyncio.sleep(0)
+            assert limiter.waiting == 1
+            with pytest.raises(Overloaded):
+                await limiter._acquire()  # queue full
+            with pytest.raises(Overloaded):
+                await queued  # gave up after max_wait
+            assert limiter.waiting == 0
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,12 @@
+from app.agents import agent_1_image_issue
+
+
+def test_followup_uses_previous_caption_only_in_the_prompt(monkeypatch):
+    prompts = []
+    monkeypatch.setattr(agent_1_image_issue, "call_openai_prompt",
+                        lambda prompt, **_: prompts.append(prompt) or '{"issue": "mould"}')
+    state = agent_1_image_issue.agent_1_node({"text": "is it getting worse?",
+                                              "last_caption": "black mould above a window"})
+    assert "black mould above a window" in prompts[0]
+    assert state["agent"] == "agent_1"
+    assert state.get("caption") is None
@@ -0,0 +1,40 @@
+from app.agents import agent_2_faq
+
+
+class _Cache:
+    def __init__(self):
+        self.gets, self.puts = [], []
+
+    def get(self, *key):
+        self.gets.append(key)
+        return None
+
+    def put(self, *entry):
+        self.puts.append(entry)
+
+
+def _run(monkeypatch, state):
+    cache = _Cache()
+    monkeypatch.setattr(agent_2_faq, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(agent_2_faq, "call_openai_prompt", lambda prompt, **_: '{"answer": "ok"}')
+    agent_2_faq.agent_2_node(state)
+    return cache
+
+
+def test_turn_without_history_uses_the_cache(monkeypatch):
+    cache = _run(monkeypatch, {"text": "how much notice do I need"})
+    assert len(cache.gets) == 1 and len(cache.puts) == 1
+
+
+def test_turn_with_history_skips_the_cache(monkeypatch):
+    cache = _run(monkeypatch, {"text": "how much notice do I need", "history": "user: my landlord wants me out"})
+    assert cache.gets == [] and cache.puts == []
+
+
+def test_unparseable_completion_is_not_cached(monkeypatch):
+    cache = _Cache()
+    monkeypatch.setattr(agent_2_faq, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(agent_2_faq, "call_openai_prompt", lambda prompt, **_: "Sorry, something went wrong.")
+    state = agent_2_faq.agent_2_node({"text": "how much notice do I need"})
+    assert state["data"] is None and state["response"] == "Sorry, something went wrong."
+    assert cache.puts == []
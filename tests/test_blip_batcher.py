@@ -0,0 +1,38 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.blip_batcher import CaptionBatcher
+
+
+def _caption_batch(images):
+    if b"corrupt" in images:
+        raise ValueError("cannot identify image file")
+    return [f"caption of {img.decode()}" for img in images]
+
+
+def test_one_bad_image_fails_only_its_own_request():
+    async def scenario():
+        batcher = CaptionBatcher(_caption_batch, ThreadPoolExecutor(1), max_batch_size=4, max_wait_ms=50)
+        try:
+            return await asyncio.gather(*(batcher.caption(img) for img in (b"a", b"corrupt", b"b")),
+                                        return_exceptions=True)
+        finally:
+            await batcher.close()
+
+    first, bad, second = asyncio.run(scenario())
+    assert (first, second) == ("caption of a", "caption of b")
+    assert isinstance(bad, ValueError)
+
+
+def test_single_image_failure_is_raised():
+    async def scenario():
+        batcher = CaptionBatcher(_caption_batch, ThreadPoolExecutor(1), max_wait_ms=0)
+        try:
+            await batcher.caption(b"corrupt")
+        finally:
+            await batcher.close()
+
+    with pytest.raises(ValueError):
+        asyncio.run(scenario())
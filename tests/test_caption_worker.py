@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from app.services.admission import Overloaded
+from app.services.caption_worker import CaptionWorkerClient, CaptionWorkerUnavailable, _read_frame, _write_frame
+
+
+def _serve(path, reply):
+    """Run a fake worker answering every status request with ``reply`` (None: never answer)."""
+    async def handle(reader, writer):
+        await _read_frame(reader)
+        if reply is None:
+            await asyncio.sleep(3600)
+        _write_frame(writer, reply)
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_unix_server(handle, path=path)
+        async with server:
+            return await CaptionWorkerClient(path, timeout=0.2).status()
+
+    return asyncio.run(run())
+
+
+def test_missing_worker_is_unavailable(tmp_path):
+    # the only failure that may fall back to in-process captioning
+    with pytest.raises(CaptionWorkerUnavailable):
+        asyncio.run(CaptionWorkerClient(str(tmp_path / "none.sock"), timeout=0.2).status())
+
+
+def test_worker_that_never_answers_is_overloaded(tmp_path):
+    with pytest.raises(Overloaded) as caught:
+        _serve(str(tmp_path / "w.sock"), None)
+    assert (caught.value.resource, caught.value.reason) == ("caption_worker", "timeout")
+
+
+def test_worker_overload_is_raised_as_overloaded(tmp_path):
+    reply = {"error": "blip is overloaded (queue_full)",
+             "overloaded": {"resource": "blip", "reason": "queue_full", "retry_after": 2.5}}
+    with pytest.raises(Overloaded) as caught:
+        _serve(str(tmp_path / "w.sock"), reply)
+    assert (caught.value.resource, caught.value.reason, caught.value.retry_after) == ("blip", "queue_full", 2.5)
+
+
+def test_status_reply(tmp_path):
+    assert _serve(str(tmp_path / "w.sock"), {"status": {"state": "ready"}}) == {"state": "ready"}
+
+
+def test_worker_reports_its_own_overload(tmp_path, monkeypatch):
+    from app.services import blip_captioner, caption_worker
+
+    async def saturated(image_bytes):
+        raise Overloaded("blip", "queue_full", 1.5)
+
+    monkeypatch.setattr(blip_captioner, "acaption_local", saturated)
+    path = str(tmp_path / "w.sock")
+
+    async def run():
+        server = await asyncio.start_unix_server(caption_worker._handle, path=path)
+        async with server:
+            return await CaptionWorkerClient(path, timeout=1).caption(b"jpeg")
+
+    with pytest.raises(Overloaded) as caught:
+        asyncio.run(run())
+    assert caught.value.retry_after == 1.5
+
+
+def test_large_image_travels_through_shared_memory(tmp_path, monkeypatch):
+    from app.services import blip_captioner, caption_worker
+
+    async def echo_size(image_bytes):
+        return f"{len(image_bytes)} bytes"
+
+    monkeypatch.setattr(blip_captioner, "acaption_local", echo_size)
+    unregistered = []
+    # client and worker share this process's resource tracker here; record instead of unregistering twice
+    monkeypatch.setattr(caption_worker.resource_tracker, "unregister", lambda name, rtype: unregistered.append(name))
+    path = str(tmp_path / "w.sock")
+
+    async def run():
+        server = await asyncio.start_unix_server(caption_worker._handle, path=path)
+        async with server:
+            return await CaptionWorkerClient(path, timeout=1, shm_min_bytes=16).caption(b"x" * 4096)
+
+    assert asyncio.run(run()) == "4096 bytes"
+    # the worker unregisters under the same name the client's unlink() does, which is what the tracker keys on
+    worker_name, client_name = unregistered
+    assert worker_name == client_name
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.services import llm_invoker
+from app.services.llm_resilience import CircuitBreaker, CircuitOpenError
+
+
+def _half_open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_second_call_is_rejected_while_probe_in_flight():
+    breaker = _half_open_breaker()
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_cancelled_probe_releases_the_breaker(monkeypatch):
+    breaker = _half_open_breaker()
+    monkeypatch.setattr(llm_invoker, "_breaker", breaker)
+
+    async def scenario() -> str:
+        started = asyncio.Event()  # created inside the loop asyncio.run starts (3.9 binds it on creation)
+
+        async def hang(timeout: float) -> str:
+            started.set()
+            await asyncio.sleep(3600)
+            return "never"
+
+        probe = asyncio.ensure_future(llm_invoker._awith_retries(hang, 30.0))
+        await started.wait()
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def ok(timeout: float) -> str:
+            return "ok"
+        return await llm_invoker._awith_retries(ok, 30.0)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_retry_after_reports_remaining_cool_down():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    assert breaker.retry_after() == 0.0
+    breaker.record_failure()
+    assert 29.0 < breaker.retry_after() <= 30.0
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
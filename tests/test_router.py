@@ -0,0 +1,87 @@
+import pytest
+
+from app.router import classify_input, looks_like_followup, match_keywords
+
+# inflected and derived forms (including every one the old substring scan caught) keep their route
+ROUTED = [
+    ("There is dampness in the bedroom", "agent_1"),
+    ("Leakage under the sink", "agent_1"),
+    ("Paintwork is flaking", "agent_1"),
+    ("the windowsill is rotten", "agent_1"),
+    ("My tenancy was terminated without notice", "agent_2"),
+    ("The rent increased twice this year", "agent_2"),
+    ("The bathroom floor is tiled", "agent_1"),
+    ("Mould on the walls", "agent_1"),
+    ("the ceiling is leaking", "agent_1"),
+    ("mouldy corner near the door", "agent_1"),
+    ("a leaky tap in the kitchen", "agent_1"),
+    ("cracked plaster", "agent_1"),
+    ("the paint is peeling", "agent_1"),
+    ("water stained ceilings", "agent_1"),
+    ("the toilet drains slowly", "agent_1"),
+    ("I was evicted last week", "agent_2"),
+    ("who handles repairs", "agent_2"),
+    ("our leases and contracts", "agent_2"),
+    ("can the landlord keep my deposit", "agent_2"),
+    ("terminating the agreement early", "agent_2"),
+    ("the inventory inspection is tomorrow", "agent_2"),
+    ("what are my responsibilities as a tenant", "agent_2"),
+    ("hello there", "fallback"),
+    ("wait til tomorrow", "fallback"),
+    ("", "fallback"),
+    ("the tap keeps tapping", "agent_1"),
+    ("someone tapped the pipe", "agent_1"),
+    ("the sink is plugged", "agent_1"),
+]
+
+# the substring scan got these wrong; the word matcher is meant to differ
+CORRECTED = [
+    ("what about the tiling", "agent_1"),    # "tiling" never contained "tile"
+    ("I am in my current flat", "fallback"),  # "rent" in "current"
+    ("a tapestry on display", "fallback"),    # "tap" in "tapestry"
+    ("I lost my wallet", "fallback"),         # "wall" in "wallet"
+    ("we played paintball", "fallback"),      # "paint" in "paintball"
+    ("whose responsibilities are these", "agent_2"),
+]
+
+
+@pytest.mark.parametrize("text,expected", ROUTED)
+def test_routes_inflected_and_derived_forms(text, expected):
+    assert classify_input(text) == expected
+
+
+@pytest.mark.parametrize("text,expected", CORRECTED)
+def test_substring_false_positives_are_fixed(text, expected):
+    assert classify_input(text) == expected
+
+
+def test_inflections_report_their_keyword():
+    hits = match_keywords("Tiled walls, terminated lease and increased rent")
+    assert [kw for _, kw in hits.positions["agent_1"]] == ["tile", "wall"]
+    assert [kw for _, kw in hits.positions["agent_2"]] == ["terminate", "lease", "increase", "rent"]
+    hits = match_keywords("tapped, tapping and plugged")
+    assert [kw for _, kw in hits.positions["agent_1"]] == ["tap", "tap", "plug"]
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("It's near the bathroom", True),
+    ("what about the one upstairs?", True),
+    ("and the landlord said no", True),
+    ("is that normal", True),
+    ("hello", False),
+    ("thanks for that", False),
+    ("what?", False),
+    ("ok", False),
+])
+def test_looks_like_followup(text, expected):
+    assert looks_like_followup(text) is expected
+
+
+@pytest.mark.parametrize("text,agent", [("It's near the bathroom", "agent_1"), ("thanks", "fallback"), ("what?", "fallback")])
+def test_router_keeps_the_previous_agent_only_for_followups(monkeypatch, text, agent):
+    from app import langgraph_builder
+
+    monkeypatch.setattr(langgraph_builder, "get_intent_classifier", lambda: None)
+    state = langgraph_builder.router_node({"text": text, "last_agent": "agent_1"})
+    assert state["agent"] == agent
+    assert bool(state.get("followup")) is (agent == "agent_1")
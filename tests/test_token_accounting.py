@@ -0,0 +1,30 @@
+import threading
+import time
+
+from app.services import token_accounting
+
+
+def test_cold_tokenizer_never_blocks_the_caller(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(token_accounting, "_encodings", {})
+    monkeypatch.setattr(token_accounting, "_loading", set())
+    monkeypatch.setattr(token_accounting, "_fetch", lambda model: release.wait(5) and None)
+
+    started = time.perf_counter()
+    assert token_accounting.count_tokens("x" * 40, model="slow-model") == 10  # character estimate
+    assert time.perf_counter() - started < 1
+    assert "slow-model" in token_accounting._loading
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while "slow-model" not in token_accounting._encodings and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert token_accounting._encodings["slow-model"] is None
+    assert token_accounting._loading == set()
+
+
+def test_warm_tokenizer_reports_an_unavailable_tokenizer(monkeypatch):
+    monkeypatch.setattr(token_accounting, "_encodings", {})
+    monkeypatch.setattr(token_accounting, "_fetch", lambda model: None)
+    assert token_accounting.warm_tokenizer("missing") is False
+    assert token_accounting.truncate_to_tokens("word " * 20, 2, model="missing").endswith("…[truncated]")
@@ -0,0 +1,30 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.services.image_preprocess import UploadLimitMiddleware
+
+
+def _client(max_body_bytes: int):
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware, max_body_bytes=max_body_bytes)
+    reads = []
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        reads.append(len(await request.body()))
+        return {"ok": True}
+
+    return TestClient(app), reads
+
+
+def test_oversized_body_is_refused_before_it_is_read():
+    client, reads = _client(1024)
+    response = client.post("/upload", content=b"x" * 4096)
+    assert response.status_code == 413
+    assert reads == []
+
+
+def test_body_within_the_cap_passes():
+    client, reads = _client(1024)
+    assert client.post("/upload", content=b"x" * 512).status_code == 200
+    assert reads == [512]